@@ -1,20 +1,1186 @@
 # weather_nasa_3cities.py
 import requests
-from datetime import datetime
+from requests.adapters import HTTPAdapter
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+import argparse
+import csv
+import functools
+import hashlib
 import json
-import pandas as pd
+import numpy as np
 import os
+import random
+import signal
+import sqlite3
+import sys
+import threading
+import time
+from urllib.parse import quote
 
-class NASAWeather:
-    def __init__(self):
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+FORECAST_URL = "https://api.open-meteo.com/v1/forecast"
+ARCHIVE_URL = "https://archive-api.open-meteo.com/v1/archive"
+
+CITIES = {
+    "1": {"name": "Ninh Bình", "coords": (20.2506, 105.9745)},
+    "2": {"name": "Hồ Chí Minh", "coords": (10.8231, 106.6297)},
+    "3": {"name": "Hà Nội", "coords": (21.0278, 105.8342)}
+}
+
+# Model cố định cho các chức năng gộp địa điểm theo ô lưới (dedupe_grid, lệnh run). Mặc định
+# request không chỉ định model: API tự chọn model theo vùng (best match, mỗi model một độ
+# phân giải) nên không có lưới chung để gộp tọa độ
+FORECAST_MODEL = "ecmwf_ifs025"
+# Độ phân giải lưới (độ) của từng model, dùng để gộp các tọa độ cùng ô vào một lần tải/cache
+MODEL_GRID_STEPS = {"ecmwf_ifs025": 0.25}
+GRID_STEP = MODEL_GRID_STEPS[FORECAST_MODEL]
+# Model chạy 4 lần/ngày (giờ UTC), dữ liệu mới có trên API sau khoảng MODEL_RUN_DELAY
+MODEL_RUN_HOURS = (0, 6, 12, 18)
+MODEL_RUN_DELAY = timedelta(hours=3)
+# Các biến dự báo theo giờ được lấy từ API
+HOURLY_VARIABLES = ('temperature_2m', 'precipitation', 'wind_speed_10m')
+
+
+class WeatherFetchError(Exception):
+    """Lỗi khi lấy dữ liệu dự báo cho một địa điểm.
+
+    throttled: upstream vẫn trả 429 sau mọi lần thử; circuit_open: circuit breaker từ chối gửi.
+    Khi đó không nên gửi lại ngay từng địa điểm vì chỉ làm tăng tải cho upstream.
+    """
+
+    def __init__(self, message, throttled=False, circuit_open=False):
+        super().__init__(message)
+        self.throttled = throttled
+        self.circuit_open = circuit_open
+
+    @property
+    def overloaded(self):
+        return self.throttled or self.circuit_open
+
+
+def _import_pandas():
+    """Nạp pandas khi cần (xuất Excel, DataFrame) để lệnh chỉ lấy/lưu dữ liệu khởi động nhanh"""
+    import pandas
+    return pandas
+
+
+def _json_loads(raw):
+    """Giải mã JSON từ bytes; dùng orjson nếu có (nhanh hơn, không tạo chuỗi trung gian)"""
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+class Instrumentation:
+    """Đo thời gian (span) và bộ đếm của pipeline lấy dữ liệu → giải mã → xử lý → lưu.
+
+    Xuất ra JSON lines (mỗi span/bộ đếm một dòng) hoặc định dạng text của Prometheus.
+    """
+
+    def __init__(self, max_samples=10000):
+        self.max_samples = max_samples
+        self._lock = threading.Lock()
+        self._spans = {}
+        self._counters = {}
+        self._events = deque(maxlen=max_samples * 10)
+
+    @contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name, seconds):
+        with self._lock:
+            span = self._spans.get(name)
+            if span is None:
+                span = self._spans[name] = {'count': 0, 'total': 0.0, 'max': 0.0,
+                                            'samples': deque(maxlen=self.max_samples)}
+            span['count'] += 1
+            span['total'] += seconds
+            span['max'] = max(span['max'], seconds)
+            span['samples'].append(seconds)
+            self._events.append({'ts': round(time.time(), 6), 'type': 'span', 'name': name,
+                                 'seconds': round(seconds, 6)})
+
+    def count(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def snapshot(self):
+        """{'spans': {tên: count/total/p50/p99/max (giây)}, 'counters': {tên: giá trị}}"""
+        with self._lock:
+            spans = {name: dict(span, samples=list(span['samples'])) for name, span in self._spans.items()}
+            counters = dict(self._counters)
+        for span in spans.values():
+            p50, p99 = np.percentile(span.pop('samples'), [50, 99])
+            span.update(p50=float(p50), p99=float(p99))
+        return {'spans': spans, 'counters': counters}
+
+    def to_jsonl(self):
+        with self._lock:
+            events = list(self._events)
+            counters = dict(self._counters)
+        lines = [json.dumps(event, ensure_ascii=False) for event in events]
+        lines += [json.dumps({'ts': round(time.time(), 6), 'type': 'counter', 'name': name, 'value': value},
+                             ensure_ascii=False) for name, value in counters.items()]
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def to_prometheus(self, prefix="nasa_weather"):
+        snapshot = self.snapshot()
+        lines = [f"# TYPE {prefix}_span_seconds summary"]
+        for name, span in snapshot['spans'].items():
+            lines.append(f'{prefix}_span_seconds{{span="{name}",quantile="0.5"}} {span["p50"]:.6f}')
+            lines.append(f'{prefix}_span_seconds{{span="{name}",quantile="0.99"}} {span["p99"]:.6f}')
+            lines.append(f'{prefix}_span_seconds_sum{{span="{name}"}} {span["total"]:.6f}')
+            lines.append(f'{prefix}_span_seconds_count{{span="{name}"}} {span["count"]}')
+        for name, value in snapshot['counters'].items():
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            lines.append(f"{prefix}_{name}_total {value}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, path):
+        """Ghi ra file: đuôi .prom là Prometheus text, còn lại là JSON lines"""
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        content = self.to_prometheus() if path.endswith('.prom') else self.to_jsonl()
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+
+
+def _timed(span_name):
+    """Decorator ghi thời gian chạy của một phương thức vào self.instrumentation"""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.instrumentation.span(span_name):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def valid_coordinates(latitude, longitude):
+    """Tọa độ là số, vĩ độ trong [-90, 90] và kinh độ trong [-180, 180]"""
+    try:
+        latitude, longitude = float(latitude), float(longitude)
+    except (TypeError, ValueError):
+        return False
+    return -90 <= latitude <= 90 and -180 <= longitude <= 180
+
+
+def snap_to_grid(latitude, longitude, step=GRID_STEP):
+    """Làm tròn tọa độ về tâm ô lưới model gần nhất"""
+    return (round(round(float(latitude) / step) * step, 6),
+            round(round(float(longitude) / step) * step, 6))
+
+
+def next_model_update(now=None):
+    """Thời điểm (UTC) dữ liệu của lần chạy model kế tiếp có trên API"""
+    now = now or datetime.now(timezone.utc)
+    day = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    for offset in (-1, 0, 1):
+        for hour in MODEL_RUN_HOURS:
+            available = day + timedelta(days=offset, hours=hour) + MODEL_RUN_DELAY
+            if available > now:
+                return available
+    return now + timedelta(hours=6)
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Khoảng cách mặt cầu (km), nhận số hoặc mảng NumPy"""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371.0 * np.arcsin(np.sqrt(a))
+
+
+class SiteIndex:
+    """Chỉ mục địa điểm (name, lat, lon) theo ô lưới model (grid hash).
+
+    Các địa điểm cùng ô được gộp để chỉ lấy dữ liệu một lần; chỉ mục cũng trả lời
+    truy vấn "các địa điểm trong bán kính R km" và "địa điểm gần nhất".
+    """
+
+    def __init__(self, sites, grid_step=GRID_STEP):
+        self.sites = list(sites)
+        self.grid_step = grid_step
+        # Số cột lưới quanh vĩ tuyến: chỉ số cột lấy theo modulo để kinh độ ±180 nối liền nhau
+        self.lon_cells = max(1, int(round(360 / grid_step)))
+        self.cells = {}         # (hàng, cột) của ô lưới -> danh sách vị trí địa điểm
+        latitudes = np.full(len(self.sites), np.nan)
+        longitudes = np.full(len(self.sites), np.nan)
+        for i, (_, latitude, longitude) in enumerate(self.sites):
+            if valid_coordinates(latitude, longitude):
+                latitudes[i] = float(latitude)
+                longitudes[i] = float(longitude)
+        valid = ~(np.isnan(latitudes) | np.isnan(longitudes))
+        # Vị trí các địa điểm có tọa độ không hợp lệ (không thuộc ô nào)
+        self.invalid = np.flatnonzero(~valid).tolist()
+        self.latitudes = latitudes
+        self.longitudes = longitudes
+        rows = np.round(latitudes[valid] / grid_step).astype(np.int64)
+        cols = np.round(longitudes[valid] / grid_step).astype(np.int64) % self.lon_cells
+        for i, row, col in zip(np.flatnonzero(valid).tolist(), rows.tolist(), cols.tolist()):
+            self.cells.setdefault((row, col), []).append(i)
+
+    def __len__(self):
+        return len(self.sites)
+
+    def cell_of(self, latitude, longitude):
+        return (int(round(latitude / self.grid_step)), int(round(longitude / self.grid_step)) % self.lon_cells)
+
+    def cell_center(self, cell):
+        longitude = cell[1] * self.grid_step
+        # Đưa kinh độ tâm ô về (-180, 180]
+        if longitude > 180:
+            longitude -= 360
+        return (round(cell[0] * self.grid_step, 6), round(longitude, 6))
+
+    def groups(self):
+        """Danh sách (vĩ độ tâm ô, kinh độ tâm ô, [vị trí địa điểm]) theo thứ tự xuất hiện"""
+        return [(*self.cell_center(cell), members) for cell, members in self.cells.items()]
+
+    def _candidates(self, latitude, longitude, radius_km):
+        """Vị trí các địa điểm trong các ô giao với hình chữ nhật bao quanh bán kính"""
+        lat_cells = int(np.ceil(radius_km / 111.32 / self.grid_step))
+        cos_lat = max(np.cos(np.radians(min(abs(latitude) + lat_cells * self.grid_step, 89.0))), 1e-6)
+        lon_cells = int(np.ceil(radius_km / (111.32 * cos_lat) / self.grid_step))
+        if (2 * lat_cells + 1) * (2 * lon_cells + 1) >= len(self.cells):
+            # Bán kính lớn: quét toàn bộ nhanh hơn duyệt từng ô
+            return np.flatnonzero(~np.isnan(self.latitudes))
+        row, col = self.cell_of(latitude, longitude)
+        cols = {c % self.lon_cells for c in range(col - lon_cells, col + lon_cells + 1)}
+        candidates = []
+        for r in range(row - lat_cells, row + lat_cells + 1):
+            for c in cols:
+                candidates.extend(self.cells.get((r, c), ()))
+        return np.array(candidates, dtype=np.int64)
+
+    def within_radius(self, latitude, longitude, radius_km):
+        """Vị trí các địa điểm cách (latitude, longitude) không quá radius_km, gần nhất trước"""
+        candidates = self._candidates(latitude, longitude, radius_km)
+        if not len(candidates):
+            return []
+        distances = haversine_km(latitude, longitude, self.latitudes[candidates], self.longitudes[candidates])
+        inside = distances <= radius_km
+        order = np.argsort(distances[inside], kind='stable')
+        return candidates[inside][order].tolist()
+
+    def nearest(self, latitude, longitude):
+        """(vị trí, khoảng cách km) của địa điểm gần nhất, None nếu chỉ mục rỗng"""
+        if not self.cells:
+            return None
+        # Mở rộng bán kính tìm kiếm theo từng vòng ô cho tới khi có kết quả
+        radius_km = self.grid_step * 111.32
+        while True:
+            found = self.within_radius(latitude, longitude, radius_km)
+            if found:
+                i = found[0]
+                return i, float(haversine_km(latitude, longitude, self.latitudes[i], self.longitudes[i]))
+            radius_km *= 2
+
+
+class HourlyForecast:
+    """Dự báo theo giờ dạng cột: một mảng NumPy cho mỗi biến, không tạo dict cho từng giờ.
+
+    Vẫn lặp được như danh sách dict {'time', 'temperature_2m', ...} để các hàm
+    hiển thị/lưu file cũ dùng được mà không cần sửa.
+    """
+    __slots__ = ('time', 'columns')
+
+    def __init__(self, time, columns):
+        self.time = time            # numpy datetime64[m]
+        self.columns = columns      # {tên biến: numpy float64}, giá trị thiếu là NaN
+
+    @classmethod
+    def from_api(cls, hourly, variables=HOURLY_VARIABLES):
+        """Tạo trực tiếp từ các mảng song song trong trường 'hourly' của API"""
+        time = np.array(hourly['time'], dtype='datetime64[m]')
+        columns = {name: np.array(hourly[name], dtype=np.float64) for name in variables}
+        return cls(time, columns)
+
+    @classmethod
+    def from_records(cls, records, variables=HOURLY_VARIABLES):
+        """Tạo từ danh sách dict theo giờ (định dạng cũ trong file JSON)"""
+        records = list(records)
+        return cls.from_api({key: [r[key] for r in records] for key in ('time',) + tuple(variables)},
+                            variables)
+
+    def __len__(self):
+        return len(self.time)
+
+    def time_strings(self):
+        """Thời gian dạng chuỗi ISO giống API, ví dụ '2025-09-18T08:00'"""
+        return np.datetime_as_string(self.time, unit='m')
+
+    def __iter__(self):
+        names = list(self.columns)
+        values = [[None if v != v else v for v in self.columns[name].tolist()] for name in names]
+        for i, time_str in enumerate(self.time_strings().tolist()):
+            record = {'time': time_str}
+            for name, column in zip(names, values):
+                record[name] = column[i]
+            yield record
+
+    def __getitem__(self, index):
+        record = {'time': str(np.datetime_as_string(self.time[index], unit='m'))}
+        for name, column in self.columns.items():
+            value = float(column[index])
+            record[name] = None if value != value else value
+        return record
+
+    def to_records(self):
+        return list(self)
+
+    def to_frame(self):
+        """DataFrame với chỉ mục thời gian kiểu datetime64"""
+        pd = _import_pandas()
+        return pd.DataFrame(self.columns, index=pd.DatetimeIndex(self.time, name='time'))
+
+
+def stack_hourly(forecasts, variables=HOURLY_VARIABLES):
+    """Ghép HourlyForecast của nhiều địa điểm (cùng trục thời gian) thành mảng (số địa điểm, số giờ)"""
+    forecasts = list(forecasts)
+    return {name: np.stack([forecast.columns[name] for forecast in forecasts]) for name in variables}
+
+
+class AgroMetrics:
+    """Chỉ số thời tiết nông nghiệp cho nhiều địa điểm, tính dồn trên các khối giờ liên tiếp.
+
+    update() nhận mảng (số địa điểm, số giờ) của khối giờ mới và chỉ cộng thêm vào các
+    tổng tích lũy, nên thêm giờ mới không phải tính lại toàn bộ lịch sử. Ngưỡng gió tính
+    theo đơn vị của API (mặc định km/h).
+
+    ET0 tính theo ngày lịch và chỉ cho ngày đủ 24 giờ có dữ liệu: nếu start_time không phải
+    0 giờ thì ngày đầu dở dang bị bỏ qua, ngày thiếu giờ (NaN) có ET0 = NaN ở địa điểm đó.
+    """
+
+    def __init__(self, latitudes, start_time, base_temp=10.0, upper_temp=30.0, heat_threshold=35.0,
+                 wind_threshold=60.0, rain_windows=(24, 72, 168)):
+        self.latitudes = np.asarray(latitudes, dtype=np.float64)
+        sites = len(self.latitudes)
+        start_time = np.datetime64(start_time, 'h')
+        self.start_day = start_time.astype('datetime64[D]')
+        # Giờ trong ngày của giờ đầu tiên, để ET0 được tính theo ngày lịch
+        self.hour_offset = int((start_time - self.start_day).astype(np.int64))
+        self.base_temp = base_temp
+        self.upper_temp = upper_temp
+        self.heat_threshold = heat_threshold
+        self.wind_threshold = wind_threshold
+        self.rain_windows = tuple(rain_windows)
+        self.hours_seen = 0
+        self.gdd = np.zeros(sites)
+        self.heat_stress_hours = np.zeros(sites, dtype=np.int64)
+        self.wind_damage_hours = np.zeros(sites, dtype=np.int64)
+        self.precipitation_total = np.zeros(sites)
+        self.rolling_precipitation = {window: np.zeros(sites) for window in self.rain_windows}
+        self.et0_total = np.zeros(sites)
+        # Số ngày có ET0 của từng địa điểm và số ngày đủ 24 giờ đã trả về từ update()
+        self.et0_days = np.zeros(sites, dtype=np.int64)
+        self.days_completed = 0
+        # Số ngày lịch đã khép lại, kể cả ngày đầu dở dang (dùng để tính ngày trong năm)
+        self._days_closed = 0
+        # Đuôi lượng mưa (tối đa cửa sổ dài nhất - 1 giờ) để nối cửa sổ trượt qua các khối
+        self._rain_tail = np.zeros((sites, 0))
+        # Nhiệt độ của ngày đang dở: max, min, tổng, số giờ có dữ liệu
+        self._day_max = np.full(sites, np.nan)
+        self._day_min = np.full(sites, np.nan)
+        self._day_sum = np.zeros(sites)
+        self._day_count = np.zeros(sites)
+
+    def update(self, temperature, precipitation, wind_speed):
+        """Thêm một khối giờ; trả về chuỗi theo giờ của khối (mưa cộng dồn theo cửa sổ, cờ gió mạnh)
+        và ET0 của các ngày vừa đủ 24 giờ"""
+        temperature = np.asarray(temperature, dtype=np.float64)
+        precipitation = np.nan_to_num(np.asarray(precipitation, dtype=np.float64))
+        wind_speed = np.asarray(wind_speed, dtype=np.float64)
+        if temperature.ndim != 2 or temperature.shape[0] != len(self.latitudes):
+            raise ValueError(f"Cần mảng (số địa điểm={len(self.latitudes)}, số giờ), nhận {temperature.shape}")
+
+        # Độ ngày sinh trưởng theo giờ: nhiệt độ kẹp trong [base, upper], chia 24
+        self.gdd += np.nansum(np.clip(temperature, self.base_temp, self.upper_temp) - self.base_temp,
+                              axis=1) / 24.0
+        self.heat_stress_hours += np.count_nonzero(temperature >= self.heat_threshold, axis=1)
+        wind_damage = wind_speed >= self.wind_threshold
+        self.wind_damage_hours += np.count_nonzero(wind_damage, axis=1)
+        self.precipitation_total += precipitation.sum(axis=1)
+
+        rolling = self._update_rolling(precipitation)
+        et0 = self._update_days(temperature)
+        self.hours_seen += temperature.shape[1]
+        return {**{f"mua_{window}h": series for window, series in rolling.items()},
+                'gio_manh': wind_damage, 'et0_ngay': et0}
+
+    def _update_rolling(self, precipitation):
+        hours = precipitation.shape[1]
+        tail = self._rain_tail.shape[1]
+        joined = np.concatenate([self._rain_tail, precipitation], axis=1)
+        cumulative = np.zeros((joined.shape[0], joined.shape[1] + 1))
+        np.cumsum(joined, axis=1, out=cumulative[:, 1:])
+        end = np.arange(tail + 1, tail + hours + 1)
+        rolling = {}
+        for window in self.rain_windows:
+            series = cumulative[:, end] - cumulative[:, np.maximum(end - window, 0)]
+            rolling[window] = series
+            if hours:
+                self.rolling_precipitation[window] = series[:, -1]
+        keep = max(self.rain_windows) - 1
+        self._rain_tail = joined[:, joined.shape[1] - min(keep, joined.shape[1]):]
+        return rolling
+
+    def _update_days(self, temperature):
+        """Gom nhiệt độ theo ngày lịch, trả về ET0 (mm/ngày) của các ngày vừa hoàn tất (NaN nếu thiếu giờ)"""
+        sites, hours = temperature.shape
+        position = (self.hour_offset + self.hours_seen) % 24
+        # Ghép phần ngày đang dở với khối mới rồi cắt thành các ngày đủ 24 giờ
+        take = min(24 - position, hours) if position else 0
+        if take:
+            self._accumulate_day(temperature[:, :take])
+        finished = []
+        if take and position + take == 24:
+            finished.append((self._day_max, self._day_min, self._day_sum / np.maximum(self._day_count, 1),
+                             self._day_count))
+            self._reset_day()
+
+        full_days = (hours - take) // 24
+        if full_days:
+            block = temperature[:, take:take + full_days * 24].reshape(sites, full_days, 24)
+            count = np.count_nonzero(~np.isnan(block), axis=2)
+            finished.append((np.fmax.reduce(block, axis=2), np.fmin.reduce(block, axis=2),
+                             np.nansum(block, axis=2) / np.maximum(count, 1), count))
+        rest = take + full_days * 24
+        if rest < hours:
+            self._accumulate_day(temperature[:, rest:])
+
+        if not finished:
+            return np.zeros((sites, 0))
+        tmax = np.column_stack([f[0] for f in finished])
+        tmin = np.column_stack([f[1] for f in finished])
+        tmean = np.column_stack([f[2] for f in finished])
+        count = np.column_stack([f[3] for f in finished])
+        days = self.start_day + self._days_closed + np.arange(tmax.shape[1])
+        et0 = self._hargreaves(tmax, tmin, tmean, days)
+        et0[count < 24] = np.nan
+        if self._days_closed == 0 and self.hour_offset:
+            # Ngày đầu bắt đầu giữa chừng chưa bao giờ đủ 24 giờ
+            et0 = et0[:, 1:]
+        self._days_closed += tmax.shape[1]
+        self.et0_total += np.nansum(et0, axis=1)
+        self.et0_days += np.count_nonzero(~np.isnan(et0), axis=1)
+        self.days_completed += et0.shape[1]
+        return et0
+
+    def _accumulate_day(self, segment):
+        self._day_max = np.fmax(self._day_max, np.fmax.reduce(segment, axis=1))
+        self._day_min = np.fmin(self._day_min, np.fmin.reduce(segment, axis=1))
+        self._day_sum += np.nansum(segment, axis=1)
+        self._day_count += np.count_nonzero(~np.isnan(segment), axis=1)
+
+    def _reset_day(self):
+        self._day_max = np.full(len(self.latitudes), np.nan)
+        self._day_min = np.full(len(self.latitudes), np.nan)
+        self._day_sum = np.zeros(len(self.latitudes))
+        self._day_count = np.zeros(len(self.latitudes))
+
+    def _hargreaves(self, tmax, tmin, tmean, days):
+        """ET0 Hargreaves (mm/ngày) từ nhiệt độ ngày và bức xạ ngoài khí quyển theo vĩ độ, ngày trong năm"""
+        day_of_year = (days - days.astype('datetime64[Y]')).astype(np.int64) + 1
+        angle = 2 * np.pi * day_of_year / 365.0
+        inverse_distance = 1 + 0.033 * np.cos(angle)
+        declination = 0.409 * np.sin(angle - 1.39)
+        latitude = np.radians(self.latitudes)[:, None]
+        sunset_angle = np.arccos(np.clip(-np.tan(latitude) * np.tan(declination), -1.0, 1.0))
+        radiation = (24 * 60 / np.pi) * 0.0820 * inverse_distance * (
+            sunset_angle * np.sin(latitude) * np.sin(declination)
+            + np.cos(latitude) * np.cos(declination) * np.sin(sunset_angle))
+        return 0.0023 * 0.408 * radiation * (tmean + 17.8) * np.sqrt(np.clip(tmax - tmin, 0, None))
+
+    def summary(self):
+        """Các tổng tích lũy hiện tại cho từng địa điểm (mảng NumPy)"""
+        return {
+            'so_gio': self.hours_seen,
+            'do_ngay_sinh_truong': self.gdd,
+            'gio_nang_nong': self.heat_stress_hours,
+            'gio_gio_manh': self.wind_damage_hours,
+            'co_gio_manh': self.wind_damage_hours > 0,
+            'tong_luong_mua': self.precipitation_total,
+            **{f"mua_{window}h": total for window, total in self.rolling_precipitation.items()},
+            'et0_tich_luy': self.et0_total,
+            'so_ngay_et0': self.et0_days,
+        }
+
+
+def _json_default(obj):
+    """Cho phép json.dump ghi HourlyForecast như danh sách dict"""
+    if isinstance(obj, HourlyForecast):
+        return obj.to_records()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _import_pyarrow():
+    """Nạp pyarrow khi cần (chỉ dùng cho lưu trữ Parquet)"""
+    try:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.dataset
+        import pyarrow.fs
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("Cần cài pyarrow để lưu dữ liệu dạng Parquet: pip install pyarrow") from e
+    return pyarrow
+
+
+class ParquetStore:
+    """Lịch sử dự báo theo giờ dạng Parquet, phân vùng thanh_pho=<tên>/ngay=<YYYY-MM-DD>.
+
+    Mỗi lần ghi chỉ thêm vào các phân vùng ngày liên quan; giờ trùng với dữ liệu đã có
+    được thay bằng bản mới nhất nên lịch sử không bị ghi đè như file JSON/XLSX.
+    Cột nguon phân biệt dữ liệu dự báo với dữ liệu lịch sử (backfill). Khóa trùng là
+    (time, nguon, vi_do, kinh_do): bản dự báo mới không thay được số liệu lịch sử đã tải,
+    hai địa điểm trùng tên nhưng khác tọa độ cũng không ghi đè lên nhau.
+    """
+
+    FORECAST = 'du_bao'
+    ARCHIVE = 'luu_tru'
+
+    def __init__(self, root="datatypeparquet"):
+        self.root = root
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _partition_value(value):
+        # Đọc kiểu hive giải mã URI tên thư mục nên khi ghi phải mã hóa tương ứng,
+        # nếu không 'x%20y' sẽ được đọc lại thành 'x y'; '/' cũng thành '%2F'
+        return quote(str(value), safe='')
+
+    def _partition_path(self, city_name, day):
+        return os.path.join(self.root, f"thanh_pho={self._partition_value(city_name)}",
+                            f"ngay={day}", "data.parquet")
+
+    def append(self, weather_data, city_name):
+        """Thêm kết quả của get_weather_data vào kho, trả về số giờ đã ghi"""
+        fetched_at = datetime.strptime(weather_data['thoi_gian_cap_nhat'], "%Y-%m-%d %H:%M:%S")
+        hourly = weather_data['du_bao_ca_ngay']
+        if not isinstance(hourly, HourlyForecast):
+            hourly = HourlyForecast.from_records(hourly)
+        return self.append_hourly(city_name, weather_data['vi_do'], weather_data['kinh_do'],
+                                  hourly, fetched_at)
+
+    def append_hourly(self, city_name, latitude, longitude, hourly, fetched_at=None, kind=FORECAST):
+        """Ghi HourlyForecast vào các phân vùng ngày, bỏ các giờ trùng cùng nguồn trong dữ liệu cũ"""
+        pa = _import_pyarrow()
+        if not len(hourly):
+            return 0
+        fetched_at = np.datetime64(fetched_at or datetime.now(), 'ms')
+        days = hourly.time.astype('datetime64[D]')
+        with self._lock:
+            for day in np.unique(days):
+                mask = days == day
+                count = int(mask.sum())
+                table = pa.table({
+                    'time': pa.array(hourly.time[mask].astype('datetime64[ms]')),
+                    'vi_do': pa.array(np.full(count, float(latitude))),
+                    'kinh_do': pa.array(np.full(count, float(longitude))),
+                    **{name: pa.array(column[mask]) for name, column in hourly.columns.items()},
+                    'thoi_gian_cap_nhat': pa.array(np.full(count, fetched_at)),
+                    'nguon': pa.array([kind] * count, pa.string()),
+                })
+                self._write_partition(self._partition_path(city_name, str(day)), table, kind,
+                                      float(latitude), float(longitude))
+        return len(hourly)
+
+    def _write_partition(self, path, table, kind, latitude, longitude):
+        pa = _import_pyarrow()
+        pc = pa.compute
+        if os.path.exists(path):
+            existing = pa.parquet.read_table(path, memory_map=True)
+            if 'nguon' not in existing.column_names:
+                # File ghi trước khi có cột nguon chỉ chứa dữ liệu dự báo
+                existing = existing.append_column(
+                    'nguon', pa.array([self.FORECAST] * existing.num_rows, pa.string()))
+            # Giữ các giờ cũ không có trong lần ghi mới hoặc thuộc nguồn/tọa độ khác, giờ trùng lấy bản mới
+            replaced = pc.and_(pc.and_(pc.is_in(existing['time'], value_set=table['time']),
+                                       pc.equal(existing['nguon'], kind)),
+                               pc.and_(pc.equal(existing['vi_do'], latitude),
+                                       pc.equal(existing['kinh_do'], longitude)))
+            existing = existing.filter(pc.invert(replaced)).select(table.column_names).cast(table.schema)
+            table = pa.concat_tables([existing, table])
+        table = table.sort_by([(name, 'ascending') for name in ('time', 'nguon', 'vi_do', 'kinh_do')])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # File tạm bắt đầu bằng '.' để pyarrow.dataset bỏ qua nếu lần ghi bị ngắt giữa chừng
+        tmp_path = os.path.join(os.path.dirname(path), "." + os.path.basename(path) + ".tmp")
+        pa.parquet.write_table(table, tmp_path)
+        os.replace(tmp_path, path)
+
+    def _dataset(self):
+        pa = _import_pyarrow()
+        partitioning = pa.dataset.partitioning(
+            pa.schema([('thanh_pho', pa.string()), ('ngay', pa.string())]), flavor='hive')
+        filesystem = pa.fs.LocalFileSystem(use_mmap=True)
+        dataset = pa.dataset.dataset(self.root, format='parquet', partitioning=partitioning,
+                                     filesystem=filesystem)
+        if 'nguon' in dataset.schema.names:
+            return dataset
+        # Schema lấy từ file đầu tiên; file cũ chưa có cột nguon thì thêm vào để đọc ra null
+        schema = pa.unify_schemas([dataset.schema, pa.schema([('nguon', pa.string())])])
+        return pa.dataset.dataset(self.root, schema=schema, format='parquet',
+                                  partitioning=partitioning, filesystem=filesystem)
+
+    def read(self, city_name=None, start=None, end=None, columns=None, kind=None):
+        """Đọc dữ liệu theo địa điểm và khoảng thời gian [start, end) dưới dạng pyarrow.Table.
+
+        Bộ lọc được đẩy xuống tầng đọc: phân vùng thanh_pho/ngay không khớp bị bỏ qua
+        hoàn toàn, trong file chỉ đọc các row group thỏa điều kiện thời gian.
+        kind (FORECAST/ARCHIVE) chỉ lấy một nguồn dữ liệu.
+        """
+        pa = _import_pyarrow()
+        if not os.path.isdir(self.root):
+            return pa.table({})
+        field = pa.dataset.field
+        condition = None
+
+        def add(expression):
+            nonlocal condition
+            condition = expression if condition is None else condition & expression
+
+        if city_name is not None:
+            # Cột thanh_pho đã được giải mã khi đọc nên so với tên gốc
+            add(field('thanh_pho') == str(city_name))
+        if start is not None:
+            start = np.datetime64(start, 'ms')
+            add(field('ngay') >= str(start.astype('datetime64[D]')))
+            add(field('time') >= pa.scalar(start))
+        if end is not None:
+            end = np.datetime64(end, 'ms')
+            add(field('ngay') <= str(end.astype('datetime64[D]')))
+            add(field('time') < pa.scalar(end))
+        if kind is not None:
+            # nguon null là file cũ, chỉ chứa dữ liệu dự báo
+            matches = field('nguon') == kind
+            add(matches | field('nguon').is_null() if kind == self.FORECAST else matches)
+        dataset = self._dataset()
+        if not dataset.files:
+            return pa.table({})
+        table = dataset.to_table(columns=columns, filter=condition)
+        if 'nguon' in table.column_names:
+            index = table.column_names.index('nguon')
+            table = table.set_column(index, 'nguon', pa.compute.fill_null(table['nguon'], self.FORECAST))
+        return table
+
+    def read_frame(self, city_name=None, start=None, end=None, columns=None, kind=None):
+        """Giống read() nhưng trả về DataFrame sắp xếp theo địa điểm, thời gian và nguồn"""
+        df = self.read(city_name, start, end, columns, kind).to_pandas()
+        sort_keys = [key for key in ('thanh_pho', 'time', 'nguon') if key in df.columns]
+        return df.sort_values(sort_keys, ignore_index=True) if sort_keys else df
+
+
+def split_date_range(start_date, end_date, chunk_days):
+    """Chia [start_date, end_date] (tính cả hai đầu) thành các đoạn tối đa chunk_days ngày"""
+    chunks = []
+    chunk_start = start_date
+    while chunk_start <= end_date:
+        chunk_end = min(chunk_start + timedelta(days=chunk_days - 1), end_date)
+        chunks.append((chunk_start, chunk_end))
+        chunk_start = chunk_end + timedelta(days=1)
+    return chunks
+
+
+class ArchiveSource:
+    """Nguồn dữ liệu lịch sử theo giờ qua API archive của Open-Meteo.
+
+    Backfill chỉ cần một đối tượng có phương thức fetch(client, latitude, longitude,
+    start_date, end_date) trả về dict có trường 'hourly', nên có thể thay bằng nguồn khác.
+    """
+
+    def __init__(self, base_url=ARCHIVE_URL, variables=HOURLY_VARIABLES, timeout=60):
+        self.base_url = base_url
+        self.variables = variables
+        self.timeout = timeout
+
+    def fetch(self, client, latitude, longitude, start_date, end_date):
+        params = {
+            'latitude': latitude,
+            'longitude': longitude,
+            'start_date': start_date.isoformat(),
+            'end_date': end_date.isoformat(),
+            'hourly': ','.join(self.variables),
+            'timezone': 'auto'
+        }
+        return client._request_json(params, self.timeout, url=self.base_url)
+
+
+class BackfillCheckpoint:
+    """Ghi lại các đoạn ngày đã tải xong để lần chạy sau bỏ qua (file JSON)"""
+
+    def __init__(self, path=os.path.join("cache", "backfill_checkpoint.json")):
+        self.path = path
+        self._lock = threading.Lock()
+        self._done = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self._done = {site: set(chunks) for site, chunks in json.load(f).items()}
+
+    @staticmethod
+    def site_key(city_name, latitude, longitude):
+        return f"{city_name}|{latitude}|{longitude}"
+
+    @staticmethod
+    def chunk_key(chunk):
+        return f"{chunk[0].isoformat()}/{chunk[1].isoformat()}"
+
+    def is_done(self, site, chunk):
+        with self._lock:
+            return self.chunk_key(chunk) in self._done.get(site, ())
+
+    def mark_done(self, site, chunk):
+        with self._lock:
+            self._done.setdefault(site, set()).add(self.chunk_key(chunk))
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({k: sorted(v) for k, v in self._done.items()}, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+
+
+def load_sites(path):
+    """Đọc danh sách địa điểm (name, lat, lon) từ file CSV hoặc YAML.
+
+    Ném ValueError nếu có tọa độ sai/ngoài phạm vi hoặc tên trùng nhau, vì các dòng đó
+    sẽ lỗi ở mọi lượt chạy (hoặc ghi lẫn vào phân vùng của nhau trong kho Parquet).
+    """
+    if path.lower().endswith(('.yaml', '.yml')):
+        try:
+            import yaml
+        except ImportError as e:
+            raise ImportError("Cần cài PyYAML để đọc file YAML: pip install pyyaml") from e
+        with open(path, 'r', encoding='utf-8') as f:
+            data = yaml.safe_load(f) or []
+        rows = data.get('sites', []) if isinstance(data, dict) else data
+    else:
+        with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+            rows = list(csv.DictReader(f))
+
+    sites = []
+    seen = {}
+    for i, row in enumerate(rows, start=1):
+        try:
+            latitude = float(row.get('lat', row.get('latitude')))
+            longitude = float(row.get('lon', row.get('longitude')))
+        except (TypeError, ValueError):
+            raise ValueError(f"Dòng {i} trong {path} thiếu hoặc sai tọa độ: {row}")
+        if not valid_coordinates(latitude, longitude):
+            raise ValueError(f"Dòng {i} trong {path} có tọa độ ngoài phạm vi: {row}")
+        name = str(row.get('name') or f"{latitude},{longitude}")
+        if name in seen:
+            raise ValueError(f"Dòng {i} trong {path} trùng tên '{name}' với dòng {seen[name]}")
+        seen[name] = i
+        sites.append((name, latitude, longitude))
+    return sites
+
+
+class FleetScheduler:
+    """Làm mới định kỳ dữ liệu cho nhiều địa điểm, chạy không cần tương tác (cron/systemd).
+
+    Mỗi lượt bỏ qua các địa điểm còn dữ liệu mới trong cache, chia phần còn lại thành
+    các đợt và rải đều trong `spread` giây để tránh dồn request cùng lúc.
+    """
+
+    def __init__(self, client, sites, spread=0, export_formats=()):
+        self.client = client
+        self.sites = sites
+        self.spread = spread
+        self.export_formats = export_formats
+        self.stop_event = threading.Event()
+
+    def run_once(self):
+        """Chạy một lượt làm mới, trả về báo cáo tóm tắt"""
+        started = time.time()
+        pending = [site for site in self.sites if not self.client.is_fresh(site[1], site[2])]
+        summary = {'bat_dau': datetime.now().strftime("%Y-%m-%d %H:%M:%S"), 'tong': len(self.sites),
+                   'bo_qua': len(self.sites) - len(pending), 'thanh_cong': 0, 'loi': []}
+
+        dedupe_grid = bool(self.client.grid_step)
+        if dedupe_grid:
+            # Xếp các địa điểm cùng ô lưới cạnh nhau để chúng rơi vào cùng một đợt và chỉ tải một lần
+            index = SiteIndex(pending, self.client.grid_step)
+            pending = [pending[i] for _, _, members in index.groups() for i in members] + \
+                      [pending[i] for i in index.invalid]
+        wave_size = max(1, self.client.chunk_size * self.client.max_workers)
+        waves = [pending[i:i + wave_size] for i in range(0, len(pending), wave_size)]
+        for i, wave in enumerate(waves):
+            # Đợt thứ i bắt đầu tại started + i * spread / số đợt
+            delay = started + i * self.spread / len(waves) - time.time()
+            if delay > 0 and self.stop_event.wait(delay):
+                break
+            for result in self.client.get_weather_batch(wave, dedupe_grid=dedupe_grid):
+                self._handle_result(result, summary)
+
+        summary['thoi_gian_chay'] = round(time.time() - started, 2)
+        return summary
+
+    def _handle_result(self, result, summary):
+        city_name = result['thanh_pho']
+        if result['loi']:
+            summary['loi'].append([city_name, result['loi']])
+            return
+        try:
+            with self.client.instrumentation.span('save_parquet'):
+                self.client.store.append(result['du_lieu'], city_name)
+        except Exception as e:
+            summary['loi'].append([city_name, f"Lỗi khi lưu Parquet: {e}"])
+            return
+        if 'json' in self.export_formats:
+            self.client.save_to_json(result['du_lieu'], city_name)
+        if 'xlsx' in self.export_formats:
+            self.client.save_to_excel(result['du_lieu'], city_name)
+        summary['thanh_cong'] += 1
+
+    @staticmethod
+    def exit_code(summary):
+        """0: không có lỗi, 1: một phần địa điểm lỗi, 2: tất cả địa điểm cần làm mới đều lỗi"""
+        if not summary['loi']:
+            return 0
+        return 2 if summary['thanh_cong'] == 0 else 1
+
+    def next_run_delay(self, interval=None):
+        """Số giây tới lượt kế tiếp: theo interval cố định hoặc lần model có dữ liệu mới"""
+        if interval:
+            return interval
+        return max(0.0, (next_model_update() - datetime.now(timezone.utc)).total_seconds())
+
+    def run_forever(self, interval=None, on_summary=None):
+        """Chạy liên tục cho tới khi stop() (hoặc nhận SIGTERM/SIGINT), trả về báo cáo lượt cuối"""
+        summary = None
+        while not self.stop_event.is_set():
+            summary = self.run_once()
+            if on_summary:
+                on_summary(summary)
+            self.stop_event.wait(self.next_run_delay(interval))
+        return summary
+
+    def stop(self, *args):
+        self.stop_event.set()
+
+
+class RateLimiter:
+    """Token bucket: tối đa `rate` request/giây, cho phép dồn tối đa `burst` request"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst or max(1.0, self.rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Lấy một token, chờ nếu cần; trả về số giây đã chờ"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # Cho phép số token âm: mỗi luồng tự chờ phần "nợ" của mình
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class CircuitBreaker:
+    """Ngắt mạch khi upstream lỗi liên tục: sau `failure_threshold` lỗi liên tiếp thì từ chối
+    request trong `reset_timeout` giây, sau đó cho một request thử (half-open)."""
+
+    def __init__(self, failure_threshold=5, reset_timeout=60):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.open_count = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        with self._lock:
+            state = self._state()
+            if state == 'half-open':
+                # Chỉ cho một request thử, các request khác chờ kết quả của nó
+                self.opened_at = time.monotonic()
+                return True
+            return state == 'closed'
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    self.open_count += 1
+                self.opened_at = time.monotonic()
+
+
+class Transport:
+    """Tầng HTTP dưới NASAWeather: pool kết nối, giới hạn tốc độ, retry với backoff và ngắt mạch"""
+
+    RETRY_STATUS = (429, 500, 502, 503, 504)
+
+    def __init__(self, pool_size=8, rate=None, burst=None, max_retries=4, backoff_base=0.5,
+                 backoff_max=30, max_retry_after=120, breaker=None):
+        self.pool_size = pool_size
+        self.limiter = RateLimiter(rate, burst) if rate else None
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_retry_after = max_retry_after
+        self.breaker = breaker or CircuitBreaker()
         self.session = requests.Session()
+        # Kích thước pool kết nối bằng số luồng để các request song song không phải chờ nhau
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         })
-    
-    def get_nasa_gmao_forecast(self, latitude, longitude):
-        """Lấy dữ liệu dự báo sử dụng model NASA GMAO thông qua Open-Meteo"""
-        url = "https://api.open-meteo.com/v1/forecast"
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._metrics = {'requests': 0, 'retries': 0, 'throttled': 0, 'errors': 0,
+                         'rejected': 0, 'rate_limit_wait': 0.0, 'retry_wait': 0.0,
+                         'max_in_flight': 0}
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self._metrics[name] += value
+
+    def metrics(self):
+        """Bộ đếm: số request, retry, 429, thời gian chờ giới hạn tốc độ/backoff, mức dùng pool"""
+        with self._lock:
+            snapshot = dict(self._metrics)
+            snapshot['in_flight'] = self._in_flight
+        snapshot['pool_size'] = self.pool_size
+        snapshot['circuit_state'] = self.breaker.state
+        snapshot['circuit_open_count'] = self.breaker.open_count
+        return snapshot
+
+    def _backoff(self, attempt, response=None):
+        """Thời gian chờ trước lần thử tiếp: theo Retry-After nếu có, nếu không thì backoff mũ có jitter"""
+        if response is not None and response.headers.get('Retry-After'):
+            retry_after = response.headers['Retry-After']
+            try:
+                delay = float(retry_after)
+            except ValueError:
+                try:
+                    delay = (parsedate_to_datetime(retry_after) - datetime.now(timezone.utc)).total_seconds()
+                except (TypeError, ValueError):
+                    delay = None
+            if delay is not None:
+                return min(max(0.0, delay), self.max_retry_after)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _send(self, url, params, timeout):
+        with self._lock:
+            self._in_flight += 1
+            self._metrics['requests'] += 1
+            self._metrics['max_in_flight'] = max(self._metrics['max_in_flight'], self._in_flight)
+        try:
+            return self.session.get(url, params=params, timeout=timeout)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def get(self, url, params, timeout):
+        """GET có retry; trả về response 200 hoặc ném WeatherFetchError"""
+        for attempt in range(self.max_retries + 1):
+            if not self.breaker.allow():
+                self._count('rejected')
+                raise WeatherFetchError("Upstream đang lỗi, tạm ngắt kết nối (circuit breaker)",
+                                        circuit_open=True)
+            if self.limiter:
+                self._count('rate_limit_wait', self.limiter.acquire())
+
+            response = None
+            try:
+                response = self._send(url, params, timeout)
+            except requests.RequestException as e:
+                self.breaker.record_failure()
+                error = WeatherFetchError(f"Lỗi kết nối: {e}")
+            else:
+                if response.status_code == 200:
+                    self.breaker.record_success()
+                    return response
+                error = WeatherFetchError(f"Lỗi {response.status_code}",
+                                          throttled=response.status_code == 429)
+                if response.status_code == 429:
+                    self._count('throttled')
+                elif response.status_code >= 500:
+                    self.breaker.record_failure()
+                if response.status_code not in self.RETRY_STATUS:
+                    self._count('errors')
+                    raise error
+
+            if attempt == self.max_retries:
+                break
+            delay = self._backoff(attempt, response)
+            self._count('retries')
+            self._count('retry_wait', delay)
+            time.sleep(delay)
+        self._count('errors')
+        raise error
+
+
+class ForecastCache:
+    """Cache dự báo trên đĩa (SQLite), hết hạn theo lịch chạy model và giới hạn số bản ghi (LRU)"""
+
+    def __init__(self, path=os.path.join("cache", "forecast_cache.sqlite"), max_entries=5000,
+                 ttl=None, grid_step=None):
+        self.path = path
+        self.max_entries = max_entries
+        # ttl (giây) cố định; None nghĩa là hết hạn khi model có lần chạy mới
+        self.ttl = ttl
+        self.grid_step = grid_step
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS forecast ("
+            " key TEXT PRIMARY KEY, payload TEXT NOT NULL, fetched_at REAL NOT NULL,"
+            " expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_forecast_access ON forecast(last_access)")
+        self._conn.commit()
+
+    def make_key(self, latitude, longitude, params, grid_step=None):
+        """Khóa cache: tọa độ làm tròn theo lưới của model (đúng tọa độ nếu không có lưới) + các tham số còn lại"""
+        step = grid_step or self.grid_step
+        if step:
+            lat, lon = snap_to_grid(latitude, longitude, step)
+        else:
+            lat, lon = round(float(latitude), 6), round(float(longitude), 6)
+        query = {k: v for k, v in params.items() if k not in ('latitude', 'longitude')}
+        raw = json.dumps({'lat': lat, 'lon': lon, 'params': query}, sort_keys=True)
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def _expires_at(self, now):
+        if self.ttl is not None:
+            return now + self.ttl
+        return next_model_update(datetime.fromtimestamp(now, timezone.utc)).timestamp()
+
+    def get(self, key):
+        """Trả về (dữ liệu, thời điểm tải dạng epoch) nếu còn hạn, None nếu không có hoặc đã hết hạn"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload, fetched_at, expires_at FROM forecast WHERE key = ?", (key,)).fetchone()
+            if row is None or row[2] <= now:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE forecast SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        return _json_loads(row[0]), row[1]
+
+    def get_stale(self, key):
+        """Trả về (dữ liệu, thời điểm tải dạng epoch) kể cả khi đã hết hạn, None nếu không có"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload, fetched_at FROM forecast WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self.stale_hits += 1
+            self._conn.execute("UPDATE forecast SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+        return _json_loads(row[0]), row[1]
+
+    def is_fresh(self, key):
+        """Kiểm tra khóa còn hạn mà không thay đổi bộ đếm"""
+        with self._lock:
+            row = self._conn.execute("SELECT expires_at FROM forecast WHERE key = ?", (key,)).fetchone()
+        return row is not None and row[0] > time.time()
+
+    def set(self, key, payload):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO forecast (key, payload, fetched_at, expires_at, last_access)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (key, json.dumps(payload, ensure_ascii=False), now, self._expires_at(now), now))
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """Xóa các bản ghi ít được dùng nhất khi vượt quá max_entries"""
+        count = self._conn.execute("SELECT COUNT(*) FROM forecast").fetchone()[0]
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM forecast WHERE key IN"
+                " (SELECT key FROM forecast ORDER BY last_access ASC LIMIT ?)",
+                (count - self.max_entries,))
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM forecast").fetchone()[0]
+        return {'hits': self.hits, 'misses': self.misses, 'stale_hits': self.stale_hits,
+                'entries': entries}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class NASAWeather:
+    def __init__(self, base_url=FORECAST_URL, max_workers=8, timeout=30, chunk_size=50,
+                 forecast_days=1, cache=None, store=None, transport=None, model=None,
+                 grid_step=None, instrumentation=None):
+        self.base_url = base_url
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.forecast_days = forecast_days
+        # ForecastCache (tùy chọn): dùng lại dữ liệu đã lấy cho đến khi model có lần chạy mới
+        self.cache = cache
+        # ParquetStore lưu lịch sử; JSON/XLSX chỉ là định dạng xuất thêm
+        self.store = store or ParquetStore()
+        # Số địa điểm tối đa gộp vào một request (API nhận danh sách tọa độ cách nhau bởi dấu phẩy)
+        self.chunk_size = chunk_size
+        # Model gửi trong tham số request (None: API tự chọn). grid_step là độ phân giải lưới
+        # của chính model đó, dùng cho dedupe_grid và khóa cache; không có lưới thì
+        # dedupe_grid không dùng được và cache khóa theo đúng tọa độ
+        self.model = model
+        self.grid_step = grid_step or MODEL_GRID_STEPS.get(model)
+        # Retry, giới hạn tốc độ và ngắt mạch nằm ở Transport; pool kết nối theo số luồng
+        self.transport = transport or Transport(pool_size=max_workers)
+        self.session = self.transport.session
+        # Thời gian từng bước (network, json_decode, process, save_*) và bộ đếm
+        self.instrumentation = instrumentation or Instrumentation()
+
+    def _build_params(self, latitude, longitude):
+        """Tham số request dự báo cho một địa điểm"""
         params = {
             'latitude': latitude,
             'longitude': longitude,
@@ -22,60 +1188,154 @@ class NASAWeather:
             'hourly': 'temperature_2m,precipitation,wind_speed_10m',
             'daily': 'temperature_2m_max,temperature_2m_min,precipitation_sum',
             'timezone': 'auto',
-            'forecast_days': 1
+            'forecast_days': self.forecast_days
         }
+        if self.model:
+            params['models'] = self.model
+        return params
+
+    def _request_json(self, params, timeout=None, url=None):
+        """Gửi request tới API và trả về JSON, ném WeatherFetchError thay vì in lỗi ra màn hình"""
+        with self.instrumentation.span('network'):
+            response = self.transport.get(url or self.base_url, params, timeout or self.timeout)
+        self.instrumentation.count('requests')
+        self.instrumentation.count('response_bytes', len(response.content))
+        try:
+            with self.instrumentation.span('json_decode'):
+                return _json_loads(response.content)
+        except ValueError as e:
+            raise WeatherFetchError(f"Lỗi xử lý dữ liệu dự báo: {e}") from e
+
+    def _cache_key(self, latitude, longitude):
+        return self.cache.make_key(latitude, longitude, self._build_params(latitude, longitude),
+                                   self.grid_step)
+
+    def _cached_payload(self, latitude, longitude):
+        """(dữ liệu thô, thời điểm tải) còn hạn trong cache, None nếu không có cache hoặc cache miss"""
+        if self.cache is None:
+            return None
+        try:
+            key = self._cache_key(latitude, longitude)
+        except (TypeError, ValueError):
+            return None
+        return self.cache.get(key)
+
+    def _store_payload(self, latitude, longitude, data):
+        if self.cache is not None:
+            self.cache.set(self._cache_key(latitude, longitude), data)
+
+    def _download_payload(self, latitude, longitude, timeout=None):
+        """Tải dữ liệu thô từ API và ghi vào cache"""
+        data = self._request_json(self._build_params(latitude, longitude), timeout)
+        self._store_payload(latitude, longitude, data)
+        return data
+
+    def _stale_payload(self, latitude, longitude):
+        """(dữ liệu, thời điểm tải) của bản đã hết hạn trong cache, None nếu không có"""
+        if self.cache is None:
+            return None
+        try:
+            key = self._cache_key(latitude, longitude)
+        except (TypeError, ValueError):
+            return None
+        return self.cache.get_stale(key)
+
+    def is_fresh(self, latitude, longitude):
+        """Địa điểm còn dữ liệu chưa hết hạn trong cache (không có cache thì luôn False)"""
+        if self.cache is None:
+            return False
+        try:
+            return self.cache.is_fresh(self._cache_key(latitude, longitude))
+        except (TypeError, ValueError):
+            return False
+
+    def _fetch_forecast(self, latitude, longitude, timeout=None, allow_stale=False):
+        """Lấy và xử lý dự báo cho một địa điểm (ưu tiên cache).
+
+        Với allow_stale=True, nếu mạng lỗi thì dùng bản đã hết hạn trong cache: kết quả có
+        'du_lieu_cu' = True và giữ nguyên thời điểm tải gốc ở 'thoi_gian_cap_nhat'.
+        """
+        cached = self._cached_payload(latitude, longitude)
+        stale = False
+        if cached is None:
+            try:
+                cached = (self._download_payload(latitude, longitude, timeout), None)
+            except WeatherFetchError:
+                cached = self._stale_payload(latitude, longitude) if allow_stale else None
+                if cached is None:
+                    raise
+                stale = True
+        try:
+            weather_data = self._parse_forecast_data(cached[0], latitude, longitude, fetched_at=cached[1])
+        except (KeyError, IndexError, TypeError) as e:
+            raise WeatherFetchError(f"Lỗi xử lý dữ liệu dự báo: {e}") from e
+        if stale:
+            weather_data['du_lieu_cu'] = True
+        return weather_data
+
+    def _fetch_forecast_bulk(self, coordinates, timeout=None):
+        """Gộp nhiều cặp (latitude, longitude) vào một request, trả về danh sách dữ liệu thô theo thứ tự"""
+        latitudes = ",".join(str(lat) for lat, _ in coordinates)
+        longitudes = ",".join(str(lon) for _, lon in coordinates)
+        data = self._request_json(self._build_params(latitudes, longitudes), timeout)
+        # Một tọa độ thì API trả về object, nhiều tọa độ thì trả về list
+        if isinstance(data, dict):
+            data = [data]
+        if not isinstance(data, list) or len(data) != len(coordinates):
+            raise WeatherFetchError(f"Số kết quả không khớp: cần {len(coordinates)} địa điểm")
+        return data
+
+    def get_nasa_gmao_forecast(self, latitude, longitude):
+        """Lấy dữ liệu dự báo sử dụng model NASA GMAO thông qua Open-Meteo"""
         try:
             print(f"📡 CONNECTING NASA GMAO...")
-            response = self.session.get(url, params=params, timeout=30)
-            
-            if response.status_code == 200:
-                data = response.json()
-                return self._process_forecast_data(data, latitude, longitude)
-            else:
-                print(f"❌ Lỗi {response.status_code}")
-                return None
-        except Exception as e:
-            print(f"❌ Lỗi kết nối: {e}")
+            weather_data = self._fetch_forecast(latitude, longitude, allow_stale=True)
+            if weather_data.get('du_lieu_cu'):
+                print(f"⚠️ Không kết nối được, dùng dữ liệu cũ trong cache (tải lúc {weather_data['thoi_gian_cap_nhat']})")
+            return weather_data
+        except WeatherFetchError as e:
+            print(f"❌ {e}")
             return None
-            
+
     def _process_forecast_data(self, data, lat, lon):
         """DATA PROCESSING - Trả về dữ liệu dự báo chi tiết"""
         try:
-            current = data['current']
-            hourly = data['hourly']
-            daily = data['daily']
-
-            hourly_forecast = []
-            # Lấy toàn bộ 24 khung giờ dự báo
-            for i in range(len(hourly['time'])):
-                hourly_forecast.append({
-                    'time': hourly['time'][i],
-                    'temperature_2m': hourly['temperature_2m'][i],
-                    'precipitation': hourly['precipitation'][i],
-                    'wind_speed_10m': hourly['wind_speed_10m'][i]
-                })
-
-            return {
-                'thanh_pho': '',
-                'nguon': 'NASA GMAO Model via Open-Meteo',
-                'thoi_gian': current['time'],
-                'vi_do': lat,
-                'kinh_do': lon,
-                'nhiet_do_hien_tai': current['temperature_2m'],
-                'do_am': current['relative_humidity_2m'],
-                'luong_mua_hien_tai': current['precipitation'],
-                'gio_toc_do_hien_tai': current['wind_speed_10m'],
-                'ma_thoi_tiet': current['weather_code'],
-                'nhiet_do_cao_nhat_ngay': daily['temperature_2m_max'][0],
-                'nhiet_do_thap_nhat_ngay': daily['temperature_2m_min'][0],
-                'tong_luong_mua_ngay': daily['precipitation_sum'][0],
-                'du_bao_ca_ngay': hourly_forecast, # Lưu trữ toàn bộ dữ liệu dự báo 24h
-                'la_du_bao': True,
-                'thoi_gian_cap_nhat': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            }
+            return self._parse_forecast_data(data, lat, lon)
         except KeyError as e:
             print(f"❌ Lỗi xử lý dữ liệu dự báo: {e}")
             return None
+
+    @_timed('process')
+    def _parse_forecast_data(self, data, lat, lon, fetched_at=None):
+        """Chuyển dữ liệu API thành dict kết quả, ném KeyError nếu thiếu trường.
+
+        fetched_at (epoch) là lúc dữ liệu được tải về khi lấy từ cache; None nghĩa là vừa tải.
+        """
+        fetched_at = datetime.fromtimestamp(fetched_at) if fetched_at is not None else datetime.now()
+        current = data['current']
+        daily = data['daily']
+
+        # Lấy toàn bộ khung giờ dự báo dưới dạng cột
+        hourly_forecast = HourlyForecast.from_api(data['hourly'])
+
+        return {
+            'thanh_pho': '',
+            'nguon': f"Open-Meteo, model {self.model}" if self.model else 'NASA GMAO Model via Open-Meteo',
+            'thoi_gian': current['time'],
+            'vi_do': lat,
+            'kinh_do': lon,
+            'nhiet_do_hien_tai': current['temperature_2m'],
+            'do_am': current['relative_humidity_2m'],
+            'luong_mua_hien_tai': current['precipitation'],
+            'gio_toc_do_hien_tai': current['wind_speed_10m'],
+            'ma_thoi_tiet': current['weather_code'],
+            'nhiet_do_cao_nhat_ngay': daily['temperature_2m_max'][0],
+            'nhiet_do_thap_nhat_ngay': daily['temperature_2m_min'][0],
+            'tong_luong_mua_ngay': daily['precipitation_sum'][0],
+            'du_bao_ca_ngay': hourly_forecast, # Lưu trữ toàn bộ dữ liệu dự báo 24h
+            'la_du_bao': True,
+            'thoi_gian_cap_nhat': fetched_at.strftime("%Y-%m-%d %H:%M:%S")
+        }
     
     def get_weather_data(self, city_name, latitude, longitude):
         print(f"🌍 Đang lấy dữ liệu thời tiết cho {city_name}...")
@@ -86,7 +1346,210 @@ class NASAWeather:
             return weather_data
         print(f"❌ Không thể lấy dữ liệu cho {city_name}")
         return None
+
+    def get_weather_batch(self, locations, max_workers=None, timeout=None, chunk_size=None,
+                          dedupe_grid=False):
+        """Lấy dữ liệu song song cho nhiều địa điểm (city_name, latitude, longitude).
+
+        Các địa điểm được gộp thành nhóm tối đa `chunk_size` tọa độ mỗi request.
+        Với dedupe_grid=True, mỗi ô lưới model chỉ được lấy một lần rồi chia cho mọi
+        địa điểm trong ô; số liệu khi đó là của tâm ô (vi_do_tam_o, kinh_do_tam_o) và
+        client phải có model cố định hoặc grid_step.
+
+        Kết quả giữ nguyên thứ tự đầu vào; mỗi phần tử có 'du_lieu' (None nếu lỗi) và
+        'loi' (thông báo lỗi hoặc None) thay vì in lỗi ra màn hình. Khi mạng lỗi, địa
+        điểm được báo lỗi chứ không dùng bản đã hết hạn trong cache.
+        """
+        locations = list(locations)
+        if dedupe_grid and not self.grid_step:
+            raise ValueError("dedupe_grid cần model cố định (model=...) hoặc grid_step")
+        if not dedupe_grid:
+            results = self._fetch_locations(locations, max_workers, timeout, chunk_size)
+            self._count_results(results)
+            return results
+
+        index = SiteIndex(locations, self.grid_step)
+        groups = index.groups()
+        cell_results = self._fetch_locations([('', lat, lon) for lat, lon, _ in groups],
+                                             max_workers, timeout, chunk_size)
+        results = [None] * len(locations)
+        for (_, _, members), cell_result in zip(groups, cell_results):
+            for i in members:
+                results[i] = self._fan_out(locations[i], cell_result)
+        for i in index.invalid:
+            results[i] = self._invalid_result(locations[i])
+        self.instrumentation.count('grid_cells_fetched', len(groups))
+        self._count_results(results)
+        return results
+
+    def _count_results(self, results):
+        failed = sum(1 for result in results if result['loi'])
+        self.instrumentation.count('sites_ok', len(results) - failed)
+        self.instrumentation.count('sites_failed', failed)
+
+    def _error_result(self, location, error):
+        city_name, latitude, longitude = location
+        return {'thanh_pho': city_name, 'vi_do': latitude, 'kinh_do': longitude,
+                'du_lieu': None, 'loi': error}
+
+    def _invalid_result(self, location):
+        return self._error_result(location, "Tọa độ không hợp lệ")
+
+    def _fan_out(self, location, cell_result):
+        """Kết quả cho một địa điểm từ dữ liệu của ô lưới chứa nó (dùng chung HourlyForecast).
+
+        Số liệu là của tâm ô chứ không nội suy về đúng tọa độ địa điểm, nên kết quả ghi
+        kèm tọa độ tâm ô ở vi_do_tam_o/kinh_do_tam_o.
+        """
+        city_name, latitude, longitude = location
+        result = {'thanh_pho': city_name, 'vi_do': latitude, 'kinh_do': longitude,
+                  'du_lieu': None, 'loi': cell_result['loi']}
+        if cell_result['du_lieu'] is not None:
+            result['du_lieu'] = dict(cell_result['du_lieu'], thanh_pho=city_name,
+                                     vi_do=latitude, kinh_do=longitude,
+                                     vi_do_tam_o=cell_result['vi_do'],
+                                     kinh_do_tam_o=cell_result['kinh_do'])
+        return result
+
+    def _fetch_locations(self, locations, max_workers=None, timeout=None, chunk_size=None):
+        """Chia địa điểm thành các nhóm và lấy song song, mỗi nhóm một request"""
+        chunk_size = max(1, chunk_size or self.chunk_size)
+        chunks = [locations[i:i + chunk_size] for i in range(0, len(locations), chunk_size)]
+        workers = max(1, min(max_workers or self.max_workers, len(chunks) or 1))
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            chunk_results = list(executor.map(lambda chunk: self._fetch_chunk(chunk, timeout), chunks))
+        return [result for chunk in chunk_results for result in chunk]
+
+    def _fetch_chunk(self, chunk, timeout=None):
+        """Lấy một nhóm địa điểm bằng một request; nếu request gộp lỗi thì lấy lại từng địa điểm.
+
+        Riêng khi upstream đang giới hạn tốc độ (429) hoặc circuit breaker đang mở thì không
+        tách nhỏ: các địa điểm còn thiếu trong nhóm cùng nhận lỗi đó.
+        """
+        # Tọa độ sai bị loại trước khi gộp để không làm API từ chối cả nhóm
+        valid = [valid_coordinates(lat, lon) for _, lat, lon in chunk]
+        cached = [self._cached_payload(lat, lon) if ok else None
+                  for (_, lat, lon), ok in zip(chunk, valid)]
+        payloads = [entry[0] if entry else None for entry in cached]
+        # Thời điểm tải của bản trong cache, để kết quả không trông như vừa tải
+        fetched_times = [entry[1] if entry else None for entry in cached]
+        missing = [i for i, payload in enumerate(payloads) if payload is None and valid[i]]
+        overload = None
+        if len(missing) > 1:
+            coordinates = [(chunk[i][1], chunk[i][2]) for i in missing]
+            try:
+                fetched = self._fetch_forecast_bulk(coordinates, timeout)
+            except WeatherFetchError as e:
+                fetched = []
+                overload = e if e.overloaded else None
+            for i, data in zip(missing, fetched):
+                payloads[i] = data
+                self._store_payload(chunk[i][1], chunk[i][2], data)
+
+        results = []
+        for location, payload, fetched_at, ok in zip(chunk, payloads, fetched_times, valid):
+            if not ok:
+                results.append(self._invalid_result(location))
+                continue
+            error = overload
+            if payload is None and error is None:
+                try:
+                    payload = self._download_payload(location[1], location[2], timeout)
+                except WeatherFetchError as e:
+                    error = e
+                    # Một địa điểm lẻ bị 429/ngắt mạch thì các địa điểm sau cũng không gửi nữa
+                    if e.overloaded:
+                        overload = e
+            results.append(self._site_result(location, payload, fetched_at) if payload is not None
+                           else self._error_result(location, str(error)))
+        return results
+
+    def _site_result(self, location, data, fetched_at=None):
+        """Kết quả cho một địa điểm từ dữ liệu thô đã có"""
+        city_name, latitude, longitude = location
+        result = self._error_result(location, None)
+        try:
+            weather_data = self._parse_forecast_data(data, latitude, longitude, fetched_at=fetched_at)
+            weather_data['thanh_pho'] = city_name
+            result['du_lieu'] = weather_data
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            result['loi'] = f"Lỗi xử lý dữ liệu dự báo: {e}"
+        return result
     
+    def backfill(self, city_name, latitude, longitude, start_date, end_date, chunk_days=31,
+                 max_workers=None, source=None, checkpoint=None):
+        """Tải lịch sử theo giờ cho một địa điểm, chia theo đoạn ngày và tải song song.
+
+        Mỗi đoạn tải xong được ghi ngay vào kho Parquet rồi đánh dấu trong checkpoint,
+        nên chạy lại sau khi bị ngắt sẽ chỉ tải các đoạn còn thiếu.
+        """
+        source = source or ArchiveSource()
+        checkpoint = checkpoint or BackfillCheckpoint()
+        site = checkpoint.site_key(city_name, latitude, longitude)
+        chunks = split_date_range(start_date, end_date, chunk_days)
+        pending = [chunk for chunk in chunks if not checkpoint.is_done(site, chunk)]
+        summary = {'tong': len(chunks), 'bo_qua': len(chunks) - len(pending),
+                   'thanh_cong': 0, 'so_gio': 0, 'loi': []}
+        workers = max(1, max_workers or self.max_workers)
+
+        def fetch_chunk(chunk):
+            data = source.fetch(self, latitude, longitude, chunk[0], chunk[1])
+            return HourlyForecast.from_api(data['hourly'], source.variables)
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            queue = iter(pending)
+            running = {}
+            while True:
+                # Chỉ giữ tối đa `workers` đoạn đang tải để không giữ cả khoảng thời gian trong bộ nhớ
+                for chunk in queue:
+                    running[executor.submit(fetch_chunk, chunk)] = chunk
+                    if len(running) >= workers:
+                        break
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    chunk = running.pop(future)
+                    try:
+                        hourly = future.result()
+                    except (WeatherFetchError, KeyError, TypeError, ValueError) as e:
+                        summary['loi'].append((checkpoint.chunk_key(chunk), str(e)))
+                        continue
+                    with self.instrumentation.span('save_parquet'):
+                        summary['so_gio'] += self.store.append_hourly(
+                            city_name, latitude, longitude, hourly, kind=ParquetStore.ARCHIVE)
+                    checkpoint.mark_done(site, chunk)
+                    summary['thanh_cong'] += 1
+        return summary
+
+    def save(self, weather_data, city_name, export_formats=()):
+        """Lưu vào kho Parquet, kèm xuất thêm các định dạng trong export_formats ('json', 'xlsx')"""
+        saved = self.save_to_parquet(weather_data, city_name)
+        if 'json' in export_formats:
+            saved = self.save_to_json(weather_data, city_name) and saved
+        if 'xlsx' in export_formats:
+            saved = self.save_to_excel(weather_data, city_name) and saved
+        return saved
+
+    @_timed('save_parquet')
+    def save_to_parquet(self, weather_data, city_name):
+        """Thêm dữ liệu vào kho lịch sử Parquet (không ghi đè dữ liệu cũ)"""
+        if not weather_data:
+            return False
+        if weather_data.get('du_lieu_cu'):
+            # Bản cũ trong cache đã được ghi vào kho ở lần tải gốc
+            print("⚠️ Dữ liệu cũ từ cache, không thêm lại vào kho")
+            return True
+        try:
+            rows = self.store.append(weather_data, city_name)
+            print(f"💾 Đã thêm {rows} giờ vào kho: {self.store.root}")
+            return True
+        except Exception as e:
+            print(f"❌ Lỗi khi lưu Parquet: {e}")
+            return False
+
+    @_timed('save_json')
     def save_to_json(self, weather_data, city_name):
         """Lưu dữ liệu vào file JSON"""
         if not weather_data:
@@ -95,20 +1558,20 @@ class NASAWeather:
             os.makedirs("datatypejs", exist_ok=True)
             filename = os.path.join("datatypejs", f"{city_name}.json")
             with open(filename, 'w', encoding='utf-8') as f:
-                json.dump(weather_data, f, ensure_ascii=False, indent=2)
+                json.dump(weather_data, f, ensure_ascii=False, indent=2, default=_json_default)
             print(f"💾 Đã lưu file: {filename}")
             return True
         except Exception as e:
             print(f"❌ Lỗi khi lưu file JSON: {e}")
             return False
     
+    @_timed('save_excel')
     def save_to_excel(self, weather_data, city_name):
         """Lưu dữ liệu vào file Excel, bao gồm 24h dự báo"""
         if not weather_data:
             return False
         try:
             # Chuẩn bị dữ liệu cho DataFrame
-            excel_data = []
             base_info = {
                 'Thành_phố': city_name,
                 'Nguồn_dữ_liệu': weather_data['nguon'],
@@ -126,17 +1589,19 @@ class NASAWeather:
                 'Là_dự_báo': 'Có' if weather_data['la_du_bao'] else 'Không'
             }
 
-            # Thêm dữ liệu dự báo theo 24 giờ
-            for forecast in weather_data['du_bao_ca_ngay']:
-                row = base_info.copy()
-                row['Dự_báo_giờ'] = forecast['time']
-                row['Nhiệt_độ_giờ (C)'] = forecast['temperature_2m']
-                row['Lượng_mưa_giờ (mm)'] = forecast['precipitation']
-                row['Gió_tốc_độ_giờ (m/s)'] = forecast['wind_speed_10m']
-                excel_data.append(row)
-
-            # Tạo DataFrame và lưu vào Excel
-            df = pd.DataFrame(excel_data)
+            hourly = weather_data['du_bao_ca_ngay']
+            if not isinstance(hourly, HourlyForecast):
+                hourly = HourlyForecast.from_records(hourly)
+
+            # Tạo DataFrame theo cột: thông tin chung được lặp lại cho mọi giờ dự báo
+            pd = _import_pandas()
+            df = pd.DataFrame({
+                **base_info,
+                'Dự_báo_giờ': hourly.time_strings(),
+                'Nhiệt_độ_giờ (C)': hourly.columns['temperature_2m'],
+                'Lượng_mưa_giờ (mm)': hourly.columns['precipitation'],
+                'Gió_tốc_độ_giờ (m/s)': hourly.columns['wind_speed_10m'],
+            })
             os.makedirs("datatypexlsx", exist_ok=True)
             filename = os.path.join("datatypexlsx", f"{city_name}_24h.xlsx")
             df.to_excel(filename, index=False, engine='openpyxl')
@@ -172,18 +1637,15 @@ def display_weather_info(weather_data, city_name):
     
     print("="*50)
 
-def main():
+def main(export_formats=("json", "xlsx")):
     """Hàm chính"""
     print("🚀 ỨNG DỤNG LẤY DỮ LIỆU THỜI TIẾT TỪ NASA")
     print("📡 RUNNING...\n")
     
-    cities = {
-        "1": {"name": "Ninh Bình", "coords": (20.2506, 105.9745)},
-        "2": {"name": "Hồ Chí Minh", "coords": (10.8231, 106.6297)},
-        "3": {"name": "Hà Nội", "coords": (21.0278, 105.8342)}
-    }
+    cities = CITIES
     
-    nasa_client = NASAWeather()
+    cache = ForecastCache()
+    nasa_client = NASAWeather(cache=cache)
     while True:
         print("📍 CHỌN THÀNH PHỐ:")
         print("1. Ninh Bình")
@@ -196,28 +1658,33 @@ def main():
             choice = input("\n👉 Nhập lựa chọn của bạn (0-4): ").strip()
             
             if choice == "0":
+                stats = cache.stats()
+                print(f"📦 Cache: {stats['hits']} hit / {stats['misses']} miss ({stats['entries']} bản ghi)")
                 print("👋 Tạm biệt!")
                 break
             
             elif choice in ["1", "2", "3", "4"]:
-                selected_cities = []
-                
                 if choice == "4":
-                    selected_cities = list(cities.values())
+                    # Lấy song song tất cả thành phố thay vì lần lượt từng request
+                    locations = [(c["name"], *c["coords"]) for c in cities.values()]
+                    print(f"🌍 Đang lấy dữ liệu song song cho {len(locations)} thành phố...")
+                    results = nasa_client.get_weather_batch(locations)
                 else:
-                    selected_cities = [cities[choice]]
-                
-                for city_info in selected_cities:
-                    city_name = city_info["name"]
+                    city_info = cities[choice]
                     lat, lon = city_info["coords"]
-                    
-                    weather_data = nasa_client.get_weather_data(city_name, lat, lon)
+                    weather_data = nasa_client.get_weather_data(city_info["name"], lat, lon)
+                    results = [{'thanh_pho': city_info["name"], 'du_lieu': weather_data, 'loi': None}]
+                
+                for result in results:
+                    city_name = result['thanh_pho']
+                    weather_data = result['du_lieu']
                     
                     if weather_data:
                         display_weather_info(weather_data, city_name)
-                        nasa_client.save_to_json(weather_data, city_name)
-                        nasa_client.save_to_excel(weather_data, city_name)
+                        nasa_client.save(weather_data, city_name, export_formats)
                         print(f"✅ Hoàn thành xử lý cho {city_name}\n")
+                    elif result['loi']:
+                        print(f"❌ Không thể lấy dữ liệu cho {city_name}: {result['loi']}\n")
                     else:
                         print(f"❌ Không thể lấy dữ liệu cho {city_name}\n")
                 
@@ -231,8 +1698,132 @@ def main():
         except Exception as e:
             print(f"❌ Lỗi: {e}")
             
+def run_backfill(args):
+    """Chạy lệnh backfill, trả về mã thoát (0: thành công, 1: còn đoạn lỗi, 2: tham số sai)"""
+    if args.lat is None or args.lon is None:
+        coords = {c["name"]: c["coords"] for c in CITIES.values()}.get(args.name)
+        if coords is None:
+            print(f"❌ Không biết tọa độ của {args.name}, hãy truyền --lat và --lon")
+            return 2
+        args.lat, args.lon = coords
+    try:
+        start_date = date.fromisoformat(args.start)
+        end_date = date.fromisoformat(args.end)
+    except ValueError as e:
+        print(f"❌ Ngày không hợp lệ: {e}")
+        return 2
+
+    nasa_client = NASAWeather(store=ParquetStore(args.store))
+    source = ArchiveSource(base_url=args.archive_url)
+    checkpoint = BackfillCheckpoint(args.checkpoint)
+    print(f"🗄️ Backfill {args.name} ({args.lat}, {args.lon}) từ {start_date} đến {end_date}...")
+    summary = nasa_client.backfill(args.name, args.lat, args.lon, start_date, end_date,
+                                   chunk_days=args.chunk_days, max_workers=args.workers,
+                                   source=source, checkpoint=checkpoint)
+    print(f"✅ {summary['thanh_cong']}/{summary['tong']} đoạn đã tải, {summary['bo_qua']} đoạn bỏ qua "
+          f"(đã có trong checkpoint), {summary['so_gio']} giờ dữ liệu")
+    for chunk, error in summary['loi']:
+        print(f"❌ Đoạn {chunk}: {error}")
+    return 1 if summary['loi'] else 0
+
+
+def print_run_summary(summary, report_path=None):
+    """In báo cáo một lượt chạy và ghi ra file JSON nếu có report_path"""
+    print(f"📋 {summary['bat_dau']}: {summary['thanh_cong']} thành công, {summary['bo_qua']} bỏ qua "
+          f"(cache còn mới), {len(summary['loi'])} lỗi / {summary['tong']} địa điểm "
+          f"trong {summary['thoi_gian_chay']}s")
+    for city_name, error in summary['loi'][:20]:
+        print(f"❌ {city_name}: {error}")
+    if len(summary['loi']) > 20:
+        print(f"❌ ... và {len(summary['loi']) - 20} lỗi khác")
+    if report_path:
+        if os.path.dirname(report_path):
+            os.makedirs(os.path.dirname(report_path), exist_ok=True)
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+
+
+def run_fleet(args):
+    """Chạy lệnh run (một lượt hoặc daemon), trả về mã thoát cho cron/systemd"""
+    try:
+        sites = load_sites(args.sites)
+    except (OSError, ImportError, ValueError) as e:
+        print(f"❌ Không đọc được danh sách địa điểm: {e}")
+        return 2
+    if not sites:
+        print(f"❌ Không có địa điểm nào trong {args.sites}")
+        return 2
+
+    export_formats = tuple(f for f in args.export.split(',') if f) if args.export else ()
+    spread = args.spread if args.spread is not None else (600 if args.daemon else 0)
+    nasa_client = NASAWeather(max_workers=args.workers, chunk_size=args.chunk_size,
+                              model=args.model or None, grid_step=args.grid_step,
+                              transport=Transport(pool_size=args.workers, rate=args.rate),
+                              cache=ForecastCache(args.cache, max_entries=max(5000, 2 * len(sites))),
+                              store=ParquetStore(args.store))
+    scheduler = FleetScheduler(nasa_client, sites, spread=spread, export_formats=export_formats)
+
+    def report(summary):
+        print_run_summary(summary, args.report)
+        print(f"📶 HTTP: {nasa_client.transport.metrics()}")
+        if args.metrics_out:
+            nasa_client.instrumentation.export(args.metrics_out)
+
+    if not args.daemon:
+        summary = scheduler.run_once()
+        report(summary)
+        return scheduler.exit_code(summary)
+
+    signal.signal(signal.SIGTERM, scheduler.stop)
+    signal.signal(signal.SIGINT, scheduler.stop)
+    print(f"🛰️ Daemon: {len(sites)} địa điểm, rải request trong {spread}s mỗi lượt")
+    summary = scheduler.run_forever(args.interval, report)
+    print("👋 Đã dừng daemon")
+    return scheduler.exit_code(summary) if summary else 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Lấy dữ liệu thời tiết NASA GMAO qua Open-Meteo")
+    subparsers = parser.add_subparsers(dest="command")
+
+    backfill = subparsers.add_parser("backfill", help="Tải lịch sử theo giờ cho một địa điểm")
+    backfill.add_argument("--name", required=True, help="Tên địa điểm (dùng làm phân vùng trong kho)")
+    backfill.add_argument("--lat", type=float, help="Vĩ độ (bỏ trống nếu là thành phố có sẵn)")
+    backfill.add_argument("--lon", type=float, help="Kinh độ")
+    backfill.add_argument("--start", required=True, help="Ngày bắt đầu YYYY-MM-DD")
+    backfill.add_argument("--end", required=True, help="Ngày kết thúc YYYY-MM-DD (tính cả ngày này)")
+    backfill.add_argument("--chunk-days", type=int, default=31)
+    backfill.add_argument("--workers", type=int, default=4)
+    backfill.add_argument("--store", default="datatypeparquet")
+    backfill.add_argument("--checkpoint", default=os.path.join("cache", "backfill_checkpoint.json"))
+    backfill.add_argument("--archive-url", default=ARCHIVE_URL)
+
+    run = subparsers.add_parser("run", help="Làm mới dữ liệu cho danh sách địa điểm (không tương tác)")
+    run.add_argument("--sites", required=True, help="File CSV/YAML với các cột name, lat, lon")
+    run.add_argument("--daemon", action="store_true", help="Chạy liên tục theo lịch cập nhật model")
+    run.add_argument("--interval", type=float, help="Chu kỳ cố định (giây) thay cho lịch chạy model")
+    run.add_argument("--spread", type=float, help="Rải request trong bao nhiêu giây (mặc định 0, daemon 600)")
+    run.add_argument("--export", default="", help="Định dạng xuất thêm, ví dụ json,xlsx")
+    run.add_argument("--workers", type=int, default=8)
+    run.add_argument("--chunk-size", type=int, default=50)
+    run.add_argument("--rate", type=float, help="Giới hạn số request/giây tới API")
+    run.add_argument("--model", default=FORECAST_MODEL,
+                     help="Model dự báo, để trống (\"\") thì API tự chọn và không gộp theo ô lưới")
+    run.add_argument("--grid-step", type=float, help="Độ phân giải lưới (độ) nếu model không có sẵn")
+    run.add_argument("--store", default="datatypeparquet")
+    run.add_argument("--cache", default=os.path.join("cache", "forecast_cache.sqlite"))
+    run.add_argument("--report", help="Ghi báo cáo JSON của lượt chạy gần nhất vào file này")
+    run.add_argument("--metrics-out", help="Ghi số liệu đo thời gian: .prom (Prometheus) hoặc JSON lines")
+    return parser.parse_args(argv)
+
+
 if __name__ == "__main__":
+    args = parse_args()
     try:
+        if args.command == "backfill":
+            sys.exit(run_backfill(args))
+        if args.command == "run":
+            sys.exit(run_fleet(args))
         main()
     except KeyboardInterrupt:
         print("\n\n👋 GOODBYE")
@@ -0,0 +1,78 @@
+"""Benchmark AgroMetrics: tính một lần và tính dồn theo từng ngày trên nhiều địa điểm × nhiều giờ"""
+import argparse
+import time
+
+import numpy as np
+
+from common import load_nasa_module
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sites', type=int, default=10000)
+    parser.add_argument('--days', type=int, default=16)
+    args = parser.parse_args()
+
+    nasa = load_nasa_module()
+    hours = args.days * 24
+    rng = np.random.default_rng(0)
+    latitudes = rng.uniform(8.5, 23.5, args.sites)
+    hour_of_day = np.arange(hours) % 24
+    temperature = 24 + 8 * np.sin((hour_of_day - 9) / 24 * 2 * np.pi) + rng.normal(0, 2, (args.sites, hours))
+    precipitation = np.where(rng.random((args.sites, hours)) < 0.1, rng.gamma(1.5, 2.0, (args.sites, hours)), 0.0)
+    wind_speed = rng.gamma(2.0, 8.0, (args.sites, hours))
+    start_time = np.datetime64('2025-09-18T00')
+    print(f"{args.sites} địa điểm × {hours} giờ ({temperature.nbytes * 3 / 2**20:.0f} MiB dữ liệu đầu vào)")
+
+    start = time.perf_counter()
+    full = nasa.AgroMetrics(latitudes, start_time)
+    full.update(temperature, precipitation, wind_speed)
+    elapsed = time.perf_counter() - start
+    print(f"Tính một lần:        {elapsed:.3f}s ({args.sites * hours / elapsed / 1e6:.1f} triệu site-giờ/s)")
+
+    incremental = nasa.AgroMetrics(latitudes, start_time)
+    start = time.perf_counter()
+    for day in range(args.days):
+        block = slice(day * 24, (day + 1) * 24)
+        incremental.update(temperature[:, block], precipitation[:, block], wind_speed[:, block])
+    elapsed = time.perf_counter() - start
+    print(f"Tính dồn theo ngày:  {elapsed:.3f}s tổng, {elapsed / args.days * 1000:.1f} ms mỗi ngày thêm vào")
+
+    for name, value in full.summary().items():
+        if isinstance(value, np.ndarray):
+            assert np.allclose(value, incremental.summary()[name]), name
+    check_partial_first_day(nasa, latitudes, temperature, precipitation, wind_speed)
+    summary = full.summary()
+    print(f"Kết quả khớp nhau. Trung bình: GDD {summary['do_ngay_sinh_truong'].mean():.1f}, "
+          f"mưa {summary['tong_luong_mua'].mean():.1f} mm, ET0 {summary['et0_tich_luy'].mean():.1f} mm, "
+          f"{summary['co_gio_manh'].mean() * 100:.0f}% địa điểm có gió mạnh")
+
+
+def check_partial_first_day(nasa, latitudes, temperature, precipitation, wind_speed):
+    """Bắt đầu lúc 20 giờ: ngày đầu chỉ có 4 giờ nên không được tính ET0"""
+    head = nasa.AgroMetrics(latitudes, '2025-09-17T20')
+    result = head.update(temperature[:, :4], precipitation[:, :4], wind_speed[:, :4])
+    assert head.days_completed == 0 and result['et0_ngay'].shape[1] == 0, head.days_completed
+
+    # Các ngày đủ 24 giờ sau đó phải cho cùng ET0 như khi bắt đầu từ 0 giờ ngày kế tiếp
+    offset = nasa.AgroMetrics(latitudes, '2025-09-17T20')
+    hours = temperature.shape[1]
+    for start in range(0, hours, 7):
+        block = slice(start, min(start + 7, hours))
+        offset.update(temperature[:, block], precipitation[:, block], wind_speed[:, block])
+    midnight = nasa.AgroMetrics(latitudes, '2025-09-18T00')
+    midnight.update(temperature[:, 4:], precipitation[:, 4:], wind_speed[:, 4:])
+    assert offset.days_completed == midnight.days_completed == (hours - 4) // 24
+    assert np.allclose(offset.summary()['et0_tich_luy'], midnight.summary()['et0_tich_luy'])
+
+    # Một giờ thiếu dữ liệu làm ngày đó không có ET0 ở địa điểm đó
+    gap = temperature[:1].copy()
+    gap[0, 30] = np.nan
+    missing = nasa.AgroMetrics(latitudes[:1], '2025-09-18T00')
+    et0 = missing.update(gap, precipitation[:1], wind_speed[:1])['et0_ngay']
+    assert np.isnan(et0[0, 1]) and missing.summary()['so_ngay_et0'][0] == et0.shape[1] - 1
+    print("Ngày đầu dở dang (bắt đầu 20 giờ) và ngày thiếu giờ không được tính ET0")
+
+
+if __name__ == "__main__":
+    main()
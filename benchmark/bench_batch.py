@@ -0,0 +1,52 @@
+"""So sánh lấy dữ liệu tuần tự, song song từng địa điểm và gộp nhiều tọa độ mỗi request"""
+import argparse
+import time
+
+from common import load_nasa_module
+from stub_server import StubServer
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sites', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--chunk-size', type=int, default=50)
+    args = parser.parse_args()
+
+    nasa = load_nasa_module()
+    locations = [(f"Site {i}", 10 + i * 0.01, 105 + i * 0.01) for i in range(args.sites)]
+
+    with StubServer(latency=args.latency) as server:
+        client = nasa.NASAWeather(base_url=server.base_url, max_workers=args.workers,
+                                  model=nasa.FORECAST_MODEL)
+
+        start = time.perf_counter()
+        for _, lat, lon in locations:
+            client._fetch_forecast(lat, lon)
+        sequential = time.perf_counter() - start
+
+        start = time.perf_counter()
+        client.get_weather_batch(locations, chunk_size=1)
+        batch = time.perf_counter() - start
+
+        requests_before = server.request_count
+        start = time.perf_counter()
+        results = client.get_weather_batch(locations, chunk_size=args.chunk_size)
+        bulk = time.perf_counter() - start
+        bulk_requests = server.request_count - requests_before
+
+        requests_before = server.request_count
+        start = time.perf_counter()
+        deduped = client.get_weather_batch(locations, chunk_size=1, dedupe_grid=True)
+        dedupe = time.perf_counter() - start
+        dedupe_requests = server.request_count - requests_before
+
+    failed = sum(1 for r in results + deduped if r['loi'])
+    print(f"Tuần tự: {sequential:.2f}s | Song song ({args.workers} luồng): {batch:.2f}s | "
+          f"Gộp {args.chunk_size} tọa độ: {bulk:.2f}s ({bulk_requests} request) | "
+          f"Gộp theo ô lưới: {dedupe:.2f}s ({dedupe_requests} request) | Lỗi: {failed}")
+
+
+if __name__ == "__main__":
+    main()
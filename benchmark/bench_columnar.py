@@ -0,0 +1,81 @@
+"""So sánh bộ nhớ/thời gian: danh sách dict theo giờ (cách cũ) và HourlyForecast dạng cột"""
+import argparse
+import time
+import tracemalloc
+
+import pandas as pd
+
+from common import load_nasa_module
+from stub_server import make_forecast_payload
+
+
+def hourly_as_dicts(hourly):
+    """Cách xử lý cũ của _process_forecast_data: một dict cho mỗi giờ"""
+    return [{
+        'time': hourly['time'][i],
+        'temperature_2m': hourly['temperature_2m'][i],
+        'precipitation': hourly['precipitation'][i],
+        'wind_speed_10m': hourly['wind_speed_10m'][i]
+    } for i in range(len(hourly['time']))]
+
+
+def excel_frame_from_dicts(base_info, records):
+    """Cách cũ của save_to_excel: sao chép base_info vào từng dòng"""
+    rows = []
+    for forecast in records:
+        row = base_info.copy()
+        row['Dự_báo_giờ'] = forecast['time']
+        row['Nhiệt_độ_giờ (C)'] = forecast['temperature_2m']
+        row['Lượng_mưa_giờ (mm)'] = forecast['precipitation']
+        row['Gió_tốc_độ_giờ (m/s)'] = forecast['wind_speed_10m']
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def excel_frame_from_columns(base_info, hourly):
+    df = pd.DataFrame({
+        **base_info,
+        'Dự_báo_giờ': hourly.time_strings(),
+        'Nhiệt_độ_giờ (C)': hourly.columns['temperature_2m'],
+        'Lượng_mưa_giờ (mm)': hourly.columns['precipitation'],
+        'Gió_tốc_độ_giờ (m/s)': hourly.columns['wind_speed_10m'],
+    })
+    return df
+
+
+def measure(label, func):
+    """Chạy func, in thời gian, bộ nhớ đỉnh và bộ nhớ còn giữ lại sau khi chạy"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<32} {elapsed * 1000:9.1f} ms | đỉnh {peak / 2**20:8.1f} MiB | giữ lại {retained / 2**20:8.1f} MiB")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sites', type=int, default=1000)
+    parser.add_argument('--forecast-days', type=int, default=16)
+    args = parser.parse_args()
+
+    nasa = load_nasa_module()
+    payloads = [make_forecast_payload(10 + i * 0.01, 105, args.forecast_days)['hourly']
+                for i in range(args.sites)]
+    base_info = {'Thành_phố': 'Site', 'Nguồn_dữ_liệu': 'NASA GMAO Model via Open-Meteo',
+                 'Vĩ_độ': 10.0, 'Kinh_độ': 105.0, 'Nhiệt_độ_hiện_tại (C)': 26.0}
+    print(f"{args.sites} địa điểm × {args.forecast_days * 24} giờ")
+
+    dicts = measure("Xử lý: list[dict]", lambda: [hourly_as_dicts(h) for h in payloads])
+    columns = measure("Xử lý: HourlyForecast", lambda: [nasa.HourlyForecast.from_api(h) for h in payloads])
+    sample = min(args.sites, 100)
+    measure(f"Excel frame ({sample} site): list[dict]",
+            lambda: [excel_frame_from_dicts(base_info, r) for r in dicts[:sample]])
+    measure(f"Excel frame ({sample} site): cột",
+            lambda: [excel_frame_from_columns(base_info, h) for h in columns[:sample]])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""Benchmark toàn bộ pipeline lấy → giải mã → xử lý → lưu, phát lại response đã ghi trên đĩa (không dùng mạng).
+
+Mặc định phát lại benchmark/fixtures: response 1 ngày của ba thành phố có sẵn, dựng lại theo đúng cấu trúc
+/v1/forecast từ dữ liệu xuất ngày 2025-09-18 trong datatypejs (giờ hiện tại và tổng ngày lấy đúng số liệu đó).
+
+Ghi lại bằng response thật (cần mạng):   python bench_pipeline.py --record fixtures
+Chạy benchmark từ thư mục khác:           python bench_pipeline.py --fixtures DIR --sites 500
+--synthetic dùng payload tổng hợp (stub_server.make_forecast_payload), ví dụ cho --forecast-days khác 1.
+Vòng đầu tiên không tính giờ để import pyarrow và tạo thư mục kho không rơi vào p99.
+"""
+import argparse
+import contextlib
+import glob
+import json
+import os
+import resource
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from common import load_nasa_module
+from stub_server import make_forecast_payload
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+class ReplayResponse:
+    status_code = 200
+    headers = {}
+
+    def __init__(self, content):
+        self.content = content
+
+
+def make_replay_transport(nasa, fixtures):
+    """Transport trả về lần lượt các response đã ghi thay vì gửi request"""
+
+    class ReplayTransport(nasa.Transport):
+        def __init__(self):
+            super().__init__(pool_size=1)
+            self.position = 0
+
+        def get(self, url, params, timeout):
+            sites = str(params['latitude']).count(',') + 1
+            chosen = [fixtures[(self.position + i) % len(fixtures)] for i in range(sites)]
+            self.position += sites
+            return ReplayResponse(chosen[0] if sites == 1 else b'[' + b','.join(chosen) + b']')
+
+    return ReplayTransport()
+
+
+def record(nasa, directory, forecast_days):
+    os.makedirs(directory, exist_ok=True)
+    client = nasa.NASAWeather(forecast_days=forecast_days)
+    for city in nasa.CITIES.values():
+        lat, lon = city['coords']
+        data = client._request_json(client._build_params(lat, lon))
+        path = os.path.join(directory, f"{city['name']}_{forecast_days}d.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        print(f"💾 Đã ghi {path}")
+
+
+def load_fixtures(directory, forecast_days):
+    if directory:
+        # Cùng cách đặt tên với record(): <thành phố>_<số ngày>d.json
+        paths = sorted(glob.glob(os.path.join(directory, f'*_{forecast_days}d.json')))
+        if not paths:
+            raise SystemExit(f"Không có file *_{forecast_days}d.json nào trong {directory} "
+                             f"(ghi bằng --record hoặc dùng --synthetic)")
+        fixtures = []
+        for path in paths:
+            with open(path, 'rb') as f:
+                fixtures.append(f.read())
+        return fixtures, f"{len(paths)} response đã ghi trong {directory}"
+    fixtures = [json.dumps(make_forecast_payload(10 + i * 0.37, 105 + i * 0.21, forecast_days)).encode('utf-8')
+                for i in range(8)]
+    return fixtures, "8 payload tổng hợp"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sites', type=int, default=200)
+    parser.add_argument('--forecast-days', type=int, default=1)
+    parser.add_argument('--fixtures', default=FIXTURES_DIR, help="Thư mục chứa các response JSON đã ghi")
+    parser.add_argument('--synthetic', action='store_true', help="Dùng payload tổng hợp thay cho --fixtures")
+    parser.add_argument('--record', metavar='DIR', help="Ghi response thật của các thành phố có sẵn vào DIR rồi thoát")
+    parser.add_argument('--export', default="", help="Định dạng xuất thêm ngoài Parquet, ví dụ json,xlsx")
+    parser.add_argument('--trace-memory', action='store_true', help="Đo heap Python đỉnh (chậm hơn)")
+    parser.add_argument('--json', help="Ghi kết quả ra file JSON để so sánh giữa các lần chạy")
+    args = parser.parse_args()
+
+    nasa = load_nasa_module()
+    if args.record:
+        record(nasa, args.record, args.forecast_days)
+        return
+
+    fixtures, source = load_fixtures(None if args.synthetic else args.fixtures, args.forecast_days)
+    export_formats = tuple(f for f in args.export.split(',') if f)
+    workdir = tempfile.mkdtemp(prefix="bench_pipeline_")
+    cwd = os.getcwd()
+    client = nasa.NASAWeather(transport=make_replay_transport(nasa, fixtures),
+                              store=nasa.ParquetStore(os.path.join(workdir, "datatypeparquet")))
+    latencies = []
+    os.chdir(workdir)
+    try:
+        # Vòng khởi động không tính giờ: import pyarrow lần đầu, tạo thư mục kho
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            weather_data = client._fetch_forecast(9.5, 104.5)
+            weather_data['thanh_pho'] = "Khởi động"
+            client.save(weather_data, "Khởi động", export_formats)
+        client.instrumentation = nasa.Instrumentation()
+        if args.trace_memory:
+            tracemalloc.start()
+        started = time.perf_counter()
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            for i in range(args.sites):
+                site_start = time.perf_counter()
+                name = f"Site {i}"
+                weather_data = client._fetch_forecast(10 + i * 0.01, 105 + i * 0.01)
+                weather_data['thanh_pho'] = name
+                client.save(weather_data, name, export_formats)
+                latencies.append(time.perf_counter() - site_start)
+        elapsed = time.perf_counter() - started
+        heap_peak = tracemalloc.get_traced_memory()[1] if args.trace_memory else None
+        if args.trace_memory:
+            tracemalloc.stop()
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    p50, p99 = np.percentile(latencies, [50, 99])
+    result = {
+        'sites': args.sites,
+        'source': source,
+        'seconds': round(elapsed, 3),
+        'sites_per_second': round(args.sites / elapsed, 1),
+        'latency_p50_ms': round(p50 * 1000, 2),
+        'latency_p99_ms': round(p99 * 1000, 2),
+        'max_rss_mib': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'heap_peak_mib': round(heap_peak / 2**20, 1) if heap_peak is not None else None,
+        'stages': client.instrumentation.snapshot()['spans'],
+    }
+
+    print(f"{args.sites} địa điểm từ {source}: {result['sites_per_second']} site/s, "
+          f"p50 {result['latency_p50_ms']} ms, p99 {result['latency_p99_ms']} ms, "
+          f"RSS đỉnh {result['max_rss_mib']} MiB"
+          + (f", heap đỉnh {result['heap_peak_mib']} MiB" if heap_peak is not None else ""))
+    for name, span in result['stages'].items():
+        print(f"  {name:<14} {span['count']:6d} lần | tổng {span['total'] * 1000:9.1f} ms | "
+              f"p50 {span['p50'] * 1000:7.3f} ms | p99 {span['p99'] * 1000:7.3f} ms")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
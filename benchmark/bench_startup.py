@@ -0,0 +1,98 @@
+"""Đo thời gian import và RSS đỉnh khi khởi động, và khi giải mã một response lớn nhiều địa điểm.
+
+Mỗi phép đo chạy trong một tiến trình Python riêng để RSS đỉnh không bị ảnh hưởng lẫn nhau.
+"Trước" mô phỏng cách cũ: import pandas ngay khi nạp module và giải mã bằng response.json()
+(bytes -> str -> json.loads); "Sau" là cách hiện tại, với orjson nếu đã cài (backend được in ra khi chạy).
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from common import load_nasa_module
+from stub_server import make_forecast_payload
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+STARTUP_CODE = """
+import resource, sys, time
+sys.path.insert(0, {bench_dir!r})
+start = time.perf_counter()
+if {eager}:
+    import pandas
+from common import load_nasa_module
+load_nasa_module()
+elapsed = time.perf_counter() - start
+print(elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+DECODE_CODE = """
+import resource, sys, time, json, tracemalloc
+sys.path.insert(0, {bench_dir!r})
+from common import load_nasa_module
+nasa = load_nasa_module()
+with open({path!r}, 'rb') as f:
+    raw = f.read()
+before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+if {traced}:
+    tracemalloc.start()
+start = time.perf_counter()
+data = json.loads(raw.decode('utf-8')) if {legacy} else nasa._json_loads(raw)
+hourly = [nasa.HourlyForecast.from_api(site['hourly']) for site in data]
+elapsed = time.perf_counter() - start
+if {traced}:
+    print(elapsed, tracemalloc.get_traced_memory()[1] // 1024)
+else:
+    print(elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before)
+"""
+
+
+def run(code, repeat):
+    """Chạy đoạn mã trong tiến trình mới `repeat` lần, trả về trung vị (giây, KiB RSS)"""
+    times, rss = [], []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+        elapsed, peak = output.stdout.split()
+        times.append(float(elapsed))
+        rss.append(int(peak))
+    return statistics.median(times), statistics.median(rss)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--sites', type=int, default=200)
+    parser.add_argument('--forecast-days', type=int, default=16)
+    args = parser.parse_args()
+
+    print("Khởi động (nạp module):")
+    for label, eager in (("Trước (pandas import sẵn)", True), ("Sau (pandas nạp khi cần)", False)):
+        elapsed, rss = run(STARTUP_CODE.format(bench_dir=BENCH_DIR, eager=eager), args.repeat)
+        print(f"  {label:<28} {elapsed * 1000:7.1f} ms | RSS đỉnh {rss / 1024:7.1f} MiB")
+
+    payload = [make_forecast_payload(10 + i * 0.01, 105, args.forecast_days) for i in range(args.sites)]
+    with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+        json.dump(payload, f)
+        path = f.name
+    try:
+        size = os.path.getsize(path) / 2**20
+        print(f"Giải mã response {args.sites} địa điểm × {args.forecast_days} ngày ({size:.1f} MiB):")
+        backend = "orjson" if load_nasa_module().orjson is not None else "json"
+        print(f"  Backend giải mã được đo: {backend}"
+              + ("" if backend == "orjson" else " (chưa cài orjson, xem install/Install library.cmd)"))
+        for label, legacy in (("Trước (response.json())", True), (f"Sau (_json_loads, {backend})", False)):
+            elapsed, rss = run(DECODE_CODE.format(bench_dir=BENCH_DIR, path=path, legacy=legacy,
+                                                  traced=False), args.repeat)
+            _, heap = run(DECODE_CODE.format(bench_dir=BENCH_DIR, path=path, legacy=legacy,
+                                             traced=True), 1)
+            print(f"  {label:<28} {elapsed * 1000:7.1f} ms | RSS tăng thêm {rss / 1024:7.1f} MiB | "
+                  f"heap Python đỉnh {heap / 1024:7.1f} MiB")
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
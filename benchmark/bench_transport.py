@@ -0,0 +1,37 @@
+"""Chạy get_weather_batch trên server giả lập có lỗi 429/5xx và in số liệu của Transport"""
+import argparse
+import time
+
+from common import load_nasa_module
+from stub_server import StubServer
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sites', type=int, default=200)
+    parser.add_argument('--fail-rate', type=float, default=0.3)
+    parser.add_argument('--rate', type=float, default=50, help="Giới hạn request/giây phía client")
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--chunk-size', type=int, default=1)
+    args = parser.parse_args()
+
+    nasa = load_nasa_module()
+    locations = [(f"Site {i}", 10 + i * 0.01, 105 + i * 0.01) for i in range(args.sites)]
+
+    with StubServer(fail_rate=args.fail_rate) as server:
+        transport = nasa.Transport(pool_size=args.workers, rate=args.rate, backoff_base=0.05,
+                                   backoff_max=1, breaker=nasa.CircuitBreaker(failure_threshold=50))
+        client = nasa.NASAWeather(base_url=server.base_url, max_workers=args.workers,
+                                  chunk_size=args.chunk_size, transport=transport)
+        start = time.perf_counter()
+        results = client.get_weather_batch(locations)
+        elapsed = time.perf_counter() - start
+
+    failed = sum(1 for r in results if r['loi'])
+    print(f"{args.sites} địa điểm trong {elapsed:.2f}s, {failed} lỗi, {server.request_count} request tới server")
+    for name, value in transport.metrics().items():
+        print(f"  {name}: {round(value, 3) if isinstance(value, float) else value}")
+
+
+if __name__ == "__main__":
+    main()
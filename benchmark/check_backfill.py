@@ -0,0 +1,124 @@
+"""Kiểm tra backfill trên server giả lập: chia đoạn ngày, giới hạn số đoạn tải song song và chạy tiếp
+từ checkpoint sau khi có đoạn lỗi.
+
+Script dừng ở assert đầu tiên sai và trả mã thoát khác 0.
+"""
+import os
+import tempfile
+import threading
+from datetime import date
+
+from common import load_nasa_module
+from stub_server import StubServer
+
+SITE = ('Hà Nội', 21.0278, 105.8342)
+START, END = date(2025, 1, 1), date(2025, 3, 15)
+HOURS = ((END - START).days + 1) * 24
+
+
+class CountingSource:
+    """Bọc ArchiveSource, đếm số đoạn đang tải cùng lúc"""
+
+    def __init__(self, source):
+        self.source = source
+        self.variables = source.variables
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def fetch(self, client, latitude, longitude, start_date, end_date):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            return self.source.fetch(client, latitude, longitude, start_date, end_date)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+
+def make_client(nasa, root):
+    transport = nasa.Transport(backoff_base=0.01, backoff_max=0.05)
+    return nasa.NASAWeather(store=nasa.ParquetStore(os.path.join(root, 'store')), transport=transport)
+
+
+def run(nasa, client, server, root, chunk_days=7, max_workers=4):
+    source = CountingSource(nasa.ArchiveSource(base_url=server.archive_url))
+    checkpoint = nasa.BackfillCheckpoint(os.path.join(root, 'checkpoint.json'))
+    before = server.request_count
+    summary = client.backfill(*SITE, START, END, chunk_days=chunk_days, max_workers=max_workers,
+                              source=source, checkpoint=checkpoint)
+    return summary, server.request_count - before, source
+
+
+def stored_hours(nasa, client):
+    table = client.store.read(SITE[0], kind=nasa.ParquetStore.ARCHIVE, columns=['time'])
+    return table.num_rows, len(set(table['time'].to_pylist()))
+
+
+def check_chunking(nasa, server, root):
+    chunks = nasa.split_date_range(START, END, 31)
+    assert chunks[0][0] == START and chunks[-1][1] == END, chunks
+    assert all((b[0] - a[1]).days == 1 for a, b in zip(chunks, chunks[1:])), chunks
+    assert all((end - start).days < 31 for start, end in chunks), chunks
+
+    client = make_client(nasa, root)
+    summary, requests, _ = run(nasa, client, server, root, chunk_days=31)
+    assert summary['tong'] == summary['thanh_cong'] == len(chunks) == requests, (summary, requests)
+    assert summary['so_gio'] == HOURS, summary
+    assert stored_hours(nasa, client) == (HOURS, HOURS)
+
+
+def check_bounded_in_flight(nasa, server, root):
+    server.httpd.latency = 0.05
+    try:
+        client = make_client(nasa, root)
+        summary, _, source = run(nasa, client, server, root, chunk_days=3, max_workers=3)
+    finally:
+        server.httpd.latency = 0.0
+    # 25 đoạn nhưng không bao giờ quá 3 đoạn đang tải cùng lúc
+    assert summary['tong'] == 25 and not summary['loi'], summary
+    assert 1 < source.max_in_flight <= 3, source.max_in_flight
+    assert client.transport.metrics()['max_in_flight'] <= 3, client.transport.metrics()
+
+
+def check_resume(nasa, server, root):
+    client = make_client(nasa, root)
+    chunks = len(nasa.split_date_range(START, END, 7))
+    # 400 không được retry nên đúng một đoạn lỗi
+    server.inject(400)
+    first, requests, _ = run(nasa, client, server, root)
+    assert len(first['loi']) == 1 and first['thanh_cong'] == chunks - 1, first
+    assert requests == chunks, requests
+
+    # Chạy lại với checkpoint đọc từ file: chỉ tải đoạn còn thiếu
+    second, requests, _ = run(nasa, client, server, root)
+    assert requests == 1, requests
+    assert second['bo_qua'] == chunks - 1 and second['thanh_cong'] == 1 and not second['loi'], second
+    assert stored_hours(nasa, client) == (HOURS, HOURS)
+
+    # Lần thứ ba không còn gì để tải, kho không bị nhân đôi
+    third, requests, _ = run(nasa, client, server, root)
+    assert requests == 0 and third['bo_qua'] == chunks, third
+    assert stored_hours(nasa, client) == (HOURS, HOURS)
+
+
+CHECKS = [
+    check_chunking,
+    check_bounded_in_flight,
+    check_resume,
+]
+
+
+def main():
+    nasa = load_nasa_module()
+    with StubServer() as server:
+        for check in CHECKS:
+            with tempfile.TemporaryDirectory() as root:
+                check(nasa, server, root)
+            print(f"✅ {check.__name__}")
+    print(f"Đạt {len(CHECKS)}/{len(CHECKS)} kiểm tra")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Kiểm tra ForecastCache: hết hạn theo TTL và theo lịch chạy model, loại bỏ LRU, bộ đếm hit/miss,
+khóa theo ô lưới và thời điểm tải gốc được giữ khi lấy từ cache.
+
+Script dừng ở assert đầu tiên sai và trả mã thoát khác 0.
+"""
+import os
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from common import load_nasa_module
+from stub_server import StubServer
+
+PARAMS = {'hourly': 'temperature_2m', 'forecast_days': 1}
+
+
+def make_cache(nasa, root, **kwargs):
+    return nasa.ForecastCache(os.path.join(root, 'cache.sqlite'), **kwargs)
+
+
+def check_hit_miss_and_ttl(nasa, root):
+    cache = make_cache(nasa, root, ttl=0.3)
+    key = cache.make_key(21.0, 105.8, PARAMS)
+    assert cache.get(key) is None
+    before = time.time()
+    cache.set(key, {'a': 1})
+    payload, fetched_at = cache.get(key)
+    assert payload == {'a': 1} and before <= fetched_at <= time.time(), fetched_at
+    assert cache.is_fresh(key)
+
+    time.sleep(0.35)
+    assert cache.get(key) is None and not cache.is_fresh(key)
+    # Bản hết hạn vẫn lấy được qua get_stale, kèm thời điểm tải gốc
+    assert cache.get_stale(key) == ({'a': 1}, fetched_at)
+    assert cache.stats() == {'hits': 1, 'misses': 2, 'stale_hits': 1, 'entries': 1}, cache.stats()
+    cache.close()
+
+
+def check_model_run_expiry(nasa, root):
+    cache = make_cache(nasa, root)
+    # Lúc 04:00 UTC, dữ liệu của lần chạy 06 UTC có trên API lúc 09:00 UTC
+    now = datetime(2025, 1, 1, 4, 0, tzinfo=timezone.utc).timestamp()
+    expected = datetime(2025, 1, 1, 9, 0, tzinfo=timezone.utc).timestamp()
+    assert cache._expires_at(now) == expected
+    now = datetime(2025, 1, 1, 22, 0, tzinfo=timezone.utc).timestamp()
+    expected = datetime(2025, 1, 2, 3, 0, tzinfo=timezone.utc).timestamp()
+    assert cache._expires_at(now) == expected
+    cache.close()
+
+
+def check_lru_eviction(nasa, root):
+    cache = make_cache(nasa, root, max_entries=3, ttl=60)
+    keys = [cache.make_key(10 + i, 105, PARAMS) for i in range(4)]
+    for key in keys[:3]:
+        cache.set(key, {'key': key})
+        time.sleep(0.01)
+    # Dùng lại khóa đầu tiên nên khóa thứ hai trở thành ít dùng nhất
+    assert cache.get(keys[0])
+    time.sleep(0.01)
+    cache.set(keys[3], {'key': keys[3]})
+    assert cache.stats()['entries'] == 3
+    assert cache.get(keys[1]) is None
+    assert all(cache.get(key) for key in (keys[0], keys[2], keys[3]))
+    cache.close()
+
+
+def check_grid_keys(nasa, root):
+    grid = make_cache(nasa, root, grid_step=0.25)
+    assert grid.make_key(21.01, 105.79, PARAMS) == grid.make_key(20.95, 105.74, PARAMS)
+    assert grid.make_key(21.01, 105.79, PARAMS) != grid.make_key(21.2, 105.79, PARAMS)
+    assert grid.make_key(21.01, 105.79, PARAMS) != grid.make_key(21.01, 105.79, dict(PARAMS, forecast_days=2))
+    grid.close()
+    # Không có lưới thì khóa theo đúng tọa độ
+    exact = make_cache(nasa, root)
+    assert exact.make_key(21.01, 105.79, PARAMS) != exact.make_key(21.02, 105.79, PARAMS)
+    exact.close()
+
+
+def check_fetch_time_on_hit(nasa, root):
+    with StubServer() as server:
+        cache = make_cache(nasa, root, ttl=60)
+        client = nasa.NASAWeather(base_url=server.base_url, cache=cache,
+                                  store=nasa.ParquetStore(os.path.join(root, 'store')))
+        first = client.get_weather_batch([('A', 21.0, 105.8), ('B', 10.8, 106.6)])
+        requests = server.request_count
+        time.sleep(1.1)
+        second = client.get_weather_batch([('A', 21.0, 105.8), ('B', 10.8, 106.6)])
+        single = client._fetch_forecast(21.0, 105.8)
+    stats = cache.stats()
+    cache.close()
+    # Lần hai lấy từ cache: không có request mới và giữ thời điểm tải của lần đầu
+    assert server.request_count == requests
+    for old, new in zip(first, second):
+        assert new['du_lieu']['thoi_gian_cap_nhat'] == old['du_lieu']['thoi_gian_cap_nhat'], (old, new)
+    assert single['thoi_gian_cap_nhat'] == first[0]['du_lieu']['thoi_gian_cap_nhat']
+    assert stats['hits'] == 3, stats
+
+
+CHECKS = [
+    check_hit_miss_and_ttl,
+    check_model_run_expiry,
+    check_lru_eviction,
+    check_grid_keys,
+    check_fetch_time_on_hit,
+]
+
+
+def main():
+    nasa = load_nasa_module()
+    for check in CHECKS:
+        with tempfile.TemporaryDirectory() as root:
+            check(nasa, root)
+        print(f"✅ {check.__name__}")
+    print(f"Đạt {len(CHECKS)}/{len(CHECKS)} kiểm tra")
+
+
+if __name__ == "__main__":
+    main()
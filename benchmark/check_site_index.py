@@ -0,0 +1,85 @@
+"""Kiểm tra SiteIndex với cách tính vét cạn bằng haversine: truy vấn bán kính, địa điểm gần nhất
+và gộp theo ô lưới, gồm cả các địa điểm sát kinh tuyến ±180 và gần cực.
+
+Script dừng ở assert đầu tiên sai và trả mã thoát khác 0.
+"""
+import numpy as np
+
+from common import load_nasa_module
+
+
+def make_sites(rng, count=3000):
+    latitudes = np.concatenate([rng.uniform(-60, 60, count),
+                                rng.uniform(-5, 5, 300),        # hai bên kinh tuyến 180
+                                rng.uniform(85, 90, 100)])      # gần cực Bắc
+    longitudes = np.concatenate([rng.uniform(-180, 180, count),
+                                 rng.choice([-1, 1], 300) * rng.uniform(179, 180, 300),
+                                 rng.uniform(-180, 180, 100)])
+    sites = [(f"Site {i}", float(lat), float(lon)) for i, (lat, lon) in enumerate(zip(latitudes, longitudes))]
+    # Tọa độ sai không thuộc ô nào và không bao giờ được trả về
+    return sites + [("Sai", 95.0, 10.0), ("Sai", "x", 10.0)]
+
+
+def brute_force(nasa, sites, latitude, longitude):
+    coords = np.array([(lat, lon) for _, lat, lon in sites[:-2]])
+    return nasa.haversine_km(latitude, longitude, coords[:, 0], coords[:, 1])
+
+
+def check_within_radius(nasa, index, sites, queries):
+    for latitude, longitude, radius_km in queries:
+        distances = brute_force(nasa, sites, latitude, longitude)
+        found = index.within_radius(latitude, longitude, radius_km)
+        expected = set(np.flatnonzero(distances <= radius_km).tolist())
+        assert set(found) == expected, (latitude, longitude, radius_km, sorted(expected - set(found)))
+        assert all(np.diff(distances[found]) >= 0), (latitude, longitude, radius_km)
+
+
+def check_nearest(nasa, index, sites, queries):
+    for latitude, longitude, _ in queries:
+        distances = brute_force(nasa, sites, latitude, longitude)
+        i, distance = index.nearest(latitude, longitude)
+        assert np.isclose(distance, distances.min()), (latitude, longitude, i, distance, distances.min())
+
+
+def check_groups(nasa, index, sites):
+    members = sorted(i for _, _, group in index.groups() for i in group)
+    assert members == list(range(len(sites) - 2)) and index.invalid == [len(sites) - 2, len(sites) - 1]
+    half_cell = index.grid_step / 2 + 1e-9
+    for latitude, longitude, group in index.groups():
+        assert -180 < longitude <= 180, longitude
+        for i in group:
+            _, site_lat, site_lon = sites[i]
+            lon_gap = abs((site_lon - longitude + 180) % 360 - 180)
+            assert abs(site_lat - latitude) <= half_cell and lon_gap <= half_cell, (sites[i], latitude, longitude)
+
+
+def check_antimeridian(nasa):
+    index = nasa.SiteIndex([("Đông", 0.0, 179.99), ("Tây", 0.0, -179.99)], 0.25)
+    # Hai địa điểm cách nhau khoảng 2 km qua kinh tuyến 180
+    assert index.within_radius(0.0, 179.99, 10) == [0, 1]
+    assert index.nearest(0.0, -179.9)[0] == 1
+    assert len(index.groups()) == 1
+
+
+def main():
+    nasa = load_nasa_module()
+    rng = np.random.default_rng(0)
+    sites = make_sites(rng)
+    index = nasa.SiteIndex(sites, 0.25)
+    queries = [(float(lat), float(lon), float(radius)) for lat, lon, radius in zip(
+        rng.uniform(-70, 70, 150), rng.uniform(-180, 180, 150), rng.choice([5, 30, 150, 800], 150))]
+    queries += [(0.0, 179.99, 10), (0.0, -180.0, 50), (2.0, 179.5, 200), (89.5, 0.0, 100), (87.0, 170.0, 300)]
+
+    check_within_radius(nasa, index, sites, queries)
+    print("✅ check_within_radius")
+    check_nearest(nasa, index, sites, queries)
+    print("✅ check_nearest")
+    check_groups(nasa, index, sites)
+    print("✅ check_groups")
+    check_antimeridian(nasa)
+    print("✅ check_antimeridian")
+    print(f"Đạt 4/4 kiểm tra ({len(sites)} địa điểm, {len(queries)} truy vấn)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""Kiểm tra hành vi Transport với lỗi được xếp sẵn trên server giả lập (StubServer.inject).
+
+Mỗi kiểm tra dùng một Transport mới; script dừng ở assert đầu tiên sai và trả mã thoát khác 0.
+"""
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+from common import load_nasa_module
+from stub_server import StubServer
+
+PARAMS = {'latitude': 21.0, 'longitude': 105.8}
+
+
+def make_transport(nasa, **kwargs):
+    kwargs.setdefault('breaker', nasa.CircuitBreaker(failure_threshold=100))
+    return nasa.Transport(backoff_base=0.01, backoff_max=0.05, **kwargs)
+
+
+def check_retry_after_seconds(nasa, server):
+    transport = make_transport(nasa)
+    server.inject(503, retry_after=1)
+    start = time.monotonic()
+    assert transport.get(server.base_url, PARAMS, 5).status_code == 200
+    elapsed = time.monotonic() - start
+    metrics = transport.metrics()
+    assert metrics['retries'] == 1, metrics
+    assert metrics['retry_wait'] == 1.0, metrics
+    assert elapsed >= 1.0, elapsed
+
+
+def check_retry_after_http_date(nasa, server):
+    transport = make_transport(nasa)
+    retry_at = datetime.now(timezone.utc) + timedelta(seconds=2)
+    server.inject(429, retry_after=format_datetime(retry_at, usegmt=True))
+    assert transport.get(server.base_url, PARAMS, 5).status_code == 200
+    metrics = transport.metrics()
+    # Ngày giờ HTTP chỉ chính xác tới giây nên thời gian chờ nằm trong (1, 2]
+    assert metrics['throttled'] == 1 and metrics['retries'] == 1, metrics
+    assert 1.0 < metrics['retry_wait'] <= 2.0, metrics
+
+
+def check_retry_after_capped(nasa, server):
+    transport = make_transport(nasa, max_retry_after=0.2)
+    server.inject(429, retry_after=3600)
+    assert transport.get(server.base_url, PARAMS, 5).status_code == 200
+    assert transport.metrics()['retry_wait'] == 0.2, transport.metrics()
+
+
+def check_client_error_not_retried(nasa, server):
+    for status in (400, 404):
+        transport = make_transport(nasa)
+        before = server.request_count
+        server.inject(status)
+        try:
+            transport.get(server.base_url, PARAMS, 5)
+        except nasa.WeatherFetchError as e:
+            assert not e.overloaded, e
+        else:
+            raise AssertionError(f"{status} phải ném WeatherFetchError")
+        assert server.request_count - before == 1, server.request_count - before
+        assert transport.metrics()['retries'] == 0, transport.metrics()
+        assert transport.breaker.state == 'closed'
+
+
+def check_throttled_error(nasa, server):
+    transport = make_transport(nasa, max_retries=2)
+    server.inject(429, 429, 429, retry_after=0)
+    try:
+        transport.get(server.base_url, PARAMS, 5)
+    except nasa.WeatherFetchError as e:
+        assert e.throttled and not e.circuit_open, e
+    else:
+        raise AssertionError("429 ở mọi lần thử phải ném WeatherFetchError")
+    assert transport.metrics()['throttled'] == 3, transport.metrics()
+
+
+def check_circuit_breaker(nasa, server):
+    breaker = nasa.CircuitBreaker(failure_threshold=2, reset_timeout=0.5)
+    transport = make_transport(nasa, max_retries=0, breaker=breaker)
+
+    def fails():
+        try:
+            transport.get(server.base_url, PARAMS, 5)
+        except nasa.WeatherFetchError as e:
+            return e
+        return None
+
+    # Hai lỗi 5xx liên tiếp mở mạch, request tiếp theo bị từ chối mà không tới server
+    server.inject(500, 500)
+    assert fails() and fails()
+    assert breaker.state == 'open'
+    before = server.request_count
+    error = fails()
+    assert error is not None and error.circuit_open, error
+    assert server.request_count == before
+    assert transport.metrics()['rejected'] == 1
+
+    # Hết reset_timeout: half-open, request thử lỗi thì mở lại mạch
+    time.sleep(0.5)
+    assert breaker.state == 'half-open'
+    server.inject(503)
+    assert fails() is not None
+    assert breaker.state == 'open'
+    assert server.request_count == before + 1
+
+    # Half-open lần nữa, request thử thành công thì đóng mạch
+    time.sleep(0.5)
+    assert breaker.state == 'half-open'
+    assert fails() is None
+    assert breaker.state == 'closed'
+    assert breaker.open_count == 1
+
+
+def check_throttled_chunk_not_split(nasa, server):
+    transport = make_transport(nasa, max_retries=4)
+    client = nasa.NASAWeather(base_url=server.base_url, chunk_size=10, transport=transport)
+    locations = [(f"Site {i}", 10 + i * 0.5, 105 + i * 0.5) for i in range(10)]
+    before = server.request_count
+    server.inject(*[429] * 5, retry_after=0)
+    results = client.get_weather_batch(locations)
+    # Request gộp hết lượt thử vì 429 thì không tách thành 10 request riêng
+    assert server.request_count - before == 5, server.request_count - before
+    assert all(result['loi'] == "Lỗi 429" for result in results), results
+
+
+CHECKS = [
+    check_retry_after_seconds,
+    check_retry_after_http_date,
+    check_retry_after_capped,
+    check_client_error_not_retried,
+    check_throttled_error,
+    check_circuit_breaker,
+    check_throttled_chunk_not_split,
+]
+
+
+def main():
+    nasa = load_nasa_module()
+    with StubServer() as server:
+        for check in CHECKS:
+            check(nasa, server)
+            print(f"✅ {check.__name__}")
+    print(f"Đạt {len(CHECKS)}/{len(CHECKS)} kiểm tra")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,18 @@
+"""Tiện ích dùng chung cho các script benchmark"""
+import importlib.util
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAIN_SCRIPT = os.path.join(ROOT, "NASA - HN - NB - HCM.py")
+
+
+def load_nasa_module():
+    """Nạp script chính (tên file có dấu cách nên không import trực tiếp được)"""
+    if "nasa_weather" in sys.modules:
+        return sys.modules["nasa_weather"]
+    spec = importlib.util.spec_from_file_location("nasa_weather", MAIN_SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["nasa_weather"] = module
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,210 @@
+"""HTTP server giả lập API Open-Meteo để chạy thử/benchmark không cần mạng"""
+import argparse
+import collections
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def make_forecast_payload(latitude, longitude, forecast_days=1):
+    """Tạo payload có cùng cấu trúc với /v1/forecast"""
+    start = datetime(2025, 9, 18)
+    hours = 24 * forecast_days
+    times = [(start + timedelta(hours=h)).strftime("%Y-%m-%dT%H:%M") for h in range(hours)]
+    temperature = [round(25 + 5 * ((h % 24) / 23.0) + latitude % 1, 1) for h in range(hours)]
+    precipitation = [round(0.2 * (h % 5), 1) for h in range(hours)]
+    wind = [round(5 + (h % 7) * 0.8, 1) for h in range(hours)]
+    return {
+        'latitude': latitude,
+        'longitude': longitude,
+        'current': {
+            'time': times[8],
+            'temperature_2m': temperature[8],
+            'relative_humidity_2m': 80,
+            'precipitation': precipitation[8],
+            'wind_speed_10m': wind[8],
+            'weather_code': 3,
+        },
+        'hourly': {
+            'time': times,
+            'temperature_2m': temperature,
+            'precipitation': precipitation,
+            'wind_speed_10m': wind,
+        },
+        'daily': {
+            'time': [times[d * 24][:10] for d in range(forecast_days)],
+            'temperature_2m_max': [max(temperature[d * 24:(d + 1) * 24]) for d in range(forecast_days)],
+            'temperature_2m_min': [min(temperature[d * 24:(d + 1) * 24]) for d in range(forecast_days)],
+            'precipitation_sum': [round(sum(precipitation[d * 24:(d + 1) * 24]), 1) for d in range(forecast_days)],
+        },
+    }
+
+
+def make_archive_payload(latitude, longitude, start_date, end_date):
+    """Tạo payload có cùng cấu trúc với /v1/archive (chỉ dữ liệu theo giờ)"""
+    start = datetime.strptime(start_date, "%Y-%m-%d")
+    hours = ((datetime.strptime(end_date, "%Y-%m-%d") - start).days + 1) * 24
+    times = [(start + timedelta(hours=h)).strftime("%Y-%m-%dT%H:%M") for h in range(hours)]
+    return {
+        'latitude': latitude,
+        'longitude': longitude,
+        'hourly': {
+            'time': times,
+            'temperature_2m': [round(22 + 6 * ((h % 24) / 23.0) + latitude % 1, 1) for h in range(hours)],
+            'precipitation': [round(0.1 * (h % 7), 1) for h in range(hours)],
+            'wind_speed_10m': [round(4 + (h % 5) * 0.9, 1) for h in range(hours)],
+        },
+    }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body, headers=None):
+        raw = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(raw)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.request_count += 1
+        if server.latency:
+            time.sleep(server.latency)
+        fault = server.next_fault()
+        if fault:
+            status, retry_after = fault
+            headers = {'Retry-After': str(retry_after)} if retry_after is not None else None
+            self._send_json(status, {'error': True, 'reason': 'Injected fault'}, headers)
+            return
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path == '/v1/archive':
+            self._send_archive(query)
+            return
+        if url.path != '/v1/forecast':
+            self._send_json(404, {'error': True, 'reason': 'Not found'})
+            return
+        try:
+            latitudes = [float(v) for v in query['latitude'][0].split(',')]
+            longitudes = [float(v) for v in query['longitude'][0].split(',')]
+        except (KeyError, ValueError):
+            self._send_json(400, {'error': True, 'reason': 'Invalid coordinates'})
+            return
+        if len(latitudes) != len(longitudes):
+            self._send_json(400, {'error': True, 'reason': 'Coordinate lists differ in length'})
+            return
+        if len(latitudes) > 1 and not server.multi_coordinates:
+            self._send_json(400, {'error': True, 'reason': 'Multiple coordinates disabled'})
+            return
+        forecast_days = int(query.get('forecast_days', ['1'])[0])
+        payloads = [make_forecast_payload(lat, lon, forecast_days) for lat, lon in zip(latitudes, longitudes)]
+        # Giống API thật: một tọa độ trả về object, nhiều tọa độ trả về list
+        self._send_json(200, payloads[0] if len(payloads) == 1 else payloads)
+
+    def _send_archive(self, query):
+        try:
+            latitude = float(query['latitude'][0])
+            longitude = float(query['longitude'][0])
+            payload = make_archive_payload(latitude, longitude, query['start_date'][0], query['end_date'][0])
+        except (KeyError, ValueError):
+            self._send_json(400, {'error': True, 'reason': 'Invalid archive request'})
+            return
+        self._send_json(200, payload)
+
+
+class StubHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Hàng đợi mặc định (5) làm kết nối song song bị SYN retry, benchmark đo sai
+    request_queue_size = 128
+
+    def next_fault(self):
+        """Lỗi cần trả về cho request hiện tại: (status, retry_after) hoặc None"""
+        with self.lock:
+            if self.faults:
+                return self.faults.popleft()
+            if self.fail_rate and random.random() < self.fail_rate:
+                return (random.choice(self.fail_statuses), None)
+        return None
+
+
+class StubServer:
+    """Chạy server giả lập trong luồng nền: `with StubServer(latency=0.1) as server: ...`
+
+    inject() xếp hàng các lỗi (429/5xx, kèm Retry-After) cho các request kế tiếp,
+    fail_rate trả lỗi ngẫu nhiên với xác suất cho trước.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, multi_coordinates=True,
+                 fail_rate=0.0, fail_statuses=(429, 500, 503)):
+        self.httpd = StubHTTPServer((host, port), StubHandler)
+        self.httpd.latency = latency
+        self.httpd.multi_coordinates = multi_coordinates
+        self.httpd.fail_rate = fail_rate
+        self.httpd.fail_statuses = fail_statuses
+        self.httpd.faults = collections.deque()
+        self.httpd.lock = threading.Lock()
+        self.httpd.request_count = 0
+        self.thread = None
+
+    def inject(self, *statuses, retry_after=None):
+        """Các request kế tiếp lần lượt nhận các mã lỗi `statuses`"""
+        with self.httpd.lock:
+            self.httpd.faults.extend((status, retry_after) for status in statuses)
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1/forecast"
+
+    @property
+    def archive_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1/archive"
+
+    @property
+    def request_count(self):
+        return self.httpd.request_count
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Server giả lập API Open-Meteo")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help="Độ trễ mỗi request (giây)")
+    parser.add_argument('--fail-rate', type=float, default=0.0, help="Tỉ lệ request trả về 429/5xx")
+    args = parser.parse_args()
+    server = StubServer(port=args.port, latency=args.latency, fail_rate=args.fail_rate)
+    print(f"🛰️ Stub server: {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -14,12 +14,17 @@ def main():
     print("=" * 40)
     
     # Danh sách các thư viện cần kiểm tra
-    required_libraries = ['requests', 'pandas', 'openpyxl']
+    required_libraries = ['requests', 'numpy', 'pandas', 'openpyxl', 'pyarrow']
+    # Không bắt buộc: thiếu thì chương trình vẫn chạy, chỉ giải mã JSON chậm hơn
+    optional_libraries = ['orjson']
     
     all_installed = True
     for lib in required_libraries:
         if not check_library(lib):
             all_installed = False
+    for lib in optional_libraries:
+        if not check_library(lib):
+            print(f"   ({lib} không bắt buộc, cài bằng Install library.cmd)")
     
     print("=" * 40)
     if all_installed:
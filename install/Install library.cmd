@@ -1 +1 @@
-pip install requests pandas openpyxl
\ No newline at end of file
+pip install requests numpy pandas openpyxl pyarrow orjson
\ No newline at end of file